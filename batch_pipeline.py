@@ -0,0 +1,181 @@
+import csv
+import io
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# 各段階の同時実行数（デフォルト）
+EXTRACT_WORKERS = 2
+CHECK_WORKERS = 4
+
+STATUS_WAITING = "⏳ 待機中"
+STATUS_EXTRACTING = "📄 抽出中"
+STATUS_QUEUED = "🕒 分析待ち"
+STATUS_CHECKING = "🤖 分析中"
+STATUS_DONE = "✅ 完了"
+STATUS_ERROR = "❌ エラー"
+STATUS_CANCELLED = "⏹ 中止"
+
+CSV_COLUMNS = ["ファイル名", "状態", "評価点数", "承認可否", "モデル", "文字数", "抽出(秒)", "分析(秒)", "エラー"]
+
+
+class BatchPipeline:
+    """複数ファイルを「抽出 → モデル呼び出し」のパイプラインで処理
+
+    段階ごとにスレッドプールを分け、あるファイルがモデルの応答を待っている間に
+    次のファイルの抽出を進める。各段階の同時実行数はスレッド数で制限する。
+
+    extract(item, cancel_event) は抽出結果を、check(extracted, cancel_event) は
+    結果の辞書（text, score, approval, model など）を返す関数。
+    """
+
+    def __init__(self, extract, check, extract_workers=EXTRACT_WORKERS, check_workers=CHECK_WORKERS,
+                 initializer=None):
+        self._extract = extract
+        self._check = check
+        self.cancel_event = threading.Event()
+        self._updates = queue.Queue()
+        self._lock = threading.Lock()
+        self._extract_pool = ThreadPoolExecutor(max_workers=extract_workers, initializer=initializer)
+        self._check_pool = ThreadPoolExecutor(max_workers=check_workers, initializer=initializer)
+        self.jobs = []
+
+    def start(self, items, names):
+        """処理を開始（jobs はファイルごとの状態の辞書のリスト）"""
+        self.jobs = [
+            {'index': i, 'name': name, 'status': STATUS_WAITING, 'result': None, 'error': None,
+             'chars': None, 'extract_seconds': None, 'check_seconds': None}
+            for i, name in enumerate(names)
+        ]
+        for job, item in zip(self.jobs, items):
+            self._extract_pool.submit(self._run_extract, job, item)
+        return self
+
+    def _update(self, job, **values):
+        with self._lock:
+            job.update(values)
+        self._updates.put(job['index'])
+
+    def _run_extract(self, job, item):
+        if self.cancel_event.is_set():
+            self._update(job, status=STATUS_CANCELLED)
+            return
+        self._update(job, status=STATUS_EXTRACTING)
+        start = time.monotonic()
+        try:
+            extracted = self._extract(item, self.cancel_event)
+        except Exception as e:
+            self._update(job, status=STATUS_ERROR, error=f"抽出エラー: {e}")
+            return
+        self._update(
+            job, status=STATUS_QUEUED, extract_seconds=time.monotonic() - start,
+            chars=len(extracted['text']) if isinstance(extracted, dict) and 'text' in extracted else None
+        )
+        try:
+            self._check_pool.submit(self._run_check, job, extracted)
+        except RuntimeError:
+            # 中止後はプールが新しい処理を受け付けない
+            self._update(job, status=STATUS_CANCELLED)
+
+    def _run_check(self, job, extracted):
+        if self.cancel_event.is_set():
+            self._update(job, status=STATUS_CANCELLED)
+            return
+        self._update(job, status=STATUS_CHECKING)
+        start = time.monotonic()
+        try:
+            result = self._check(extracted, self.cancel_event)
+        except Exception as e:
+            self._update(job, status=STATUS_ERROR, error=f"分析エラー: {e}")
+            return
+        if self.cancel_event.is_set():
+            status = STATUS_CANCELLED
+        elif result.get('error'):
+            status = STATUS_ERROR
+        else:
+            status = STATUS_DONE
+        self._update(
+            job, status=status, result=result, error=result.get('error'),
+            check_seconds=time.monotonic() - start
+        )
+
+    @property
+    def finished(self):
+        with self._lock:
+            return all(
+                job['status'] in (STATUS_DONE, STATUS_ERROR, STATUS_CANCELLED) for job in self.jobs
+            )
+
+    def updates(self, poll_interval=0.2):
+        """状態が変わったジョブの番号を順に返す（変化がない間は poll_interval ごとに None）"""
+        while not (self.finished and self._updates.empty()):
+            try:
+                yield self._updates.get(timeout=poll_interval)
+            except queue.Empty:
+                yield None
+
+    def cancel(self):
+        """未着手のファイルを取り消し、実行中の処理に中止を通知"""
+        self.cancel_event.set()
+        self._extract_pool.shutdown(wait=False, cancel_futures=True)
+        self._check_pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for job in self.jobs:
+                if job['status'] in (STATUS_WAITING, STATUS_QUEUED):
+                    job['status'] = STATUS_CANCELLED
+
+    def close(self):
+        self._extract_pool.shutdown(wait=False)
+        self._check_pool.shutdown(wait=False)
+
+
+def job_row(job):
+    """ジョブの状態を表・CSV の1行に変換"""
+    result = job['result'] or {}
+    return {
+        "ファイル名": job['name'],
+        "状態": job['status'],
+        "評価点数": result.get('score'),
+        "承認可否": result.get('approval'),
+        "モデル": result.get('model'),
+        "文字数": job['chars'],
+        "抽出(秒)": round(job['extract_seconds'], 1) if job['extract_seconds'] is not None else None,
+        "分析(秒)": round(job['check_seconds'], 1) if job['check_seconds'] is not None else None,
+        "エラー": job['error']
+    }
+
+
+class ResultArchive:
+    """完了したファイルの結果を順に書き込む zip と CSV
+
+    結果が出るたびに zip へ追記するため、全件の完了を待たずに組み立てを進められる。
+    """
+
+    def __init__(self):
+        self._zip_buffer = io.BytesIO()
+        self._zip = zipfile.ZipFile(self._zip_buffer, "w", compression=zipfile.ZIP_DEFLATED)
+        self._rows = []
+
+    def add(self, job):
+        """完了したジョブの結果を追加"""
+        self._rows.append((job['index'], job_row(job)))
+        result = job['result'] or {}
+        if result.get('text'):
+            stem = job['name'].rsplit(".", 1)[0]
+            self._zip.writestr(f"{job['index'] + 1:03d}_{stem}_チェック結果.md", result['text'])
+
+    def csv_bytes(self):
+        """結果一覧の CSV（Excel で開けるよう BOM 付き UTF-8）"""
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(row for _, row in sorted(self._rows, key=lambda item: item[0]))
+        return output.getvalue().encode("utf-8-sig")
+
+    def zip_bytes(self):
+        """結果一覧の CSV を加えて zip を閉じ、内容を返す"""
+        self._zip.writestr("チェック結果一覧.csv", self.csv_bytes())
+        self._zip.close()
+        return self._zip_buffer.getvalue()
@@ -1,66 +1,230 @@
-import boto3
+"""Amazon Bedrock の Claude を呼び出すサンプル兼コマンドラインツール
+
+ライブラリとして call_claude_bedrock() を使うほか、標準入力または JSONL ファイルの
+プロンプトを同時実行数を制限して並列に処理し、結果を入力順に JSONL で出力できる。
+
+使用例:
+    echo "こんにちは" | python bedrock_claude_example.py --stream
+    python bedrock_claude_example.py --input prompts.jsonl --output results.jsonl --concurrency 8
+
+入力の各行は JSON オブジェクト（{"id": ..., "prompt": ..., "max_tokens": ...}）、
+JSON 文字列、またはプロンプトそのもののいずれか。
+"""
+import argparse
 import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
 
-def call_claude_bedrock(prompt, max_tokens=1000):
+from model_provider import BedrockConverseProvider
+
+DEFAULT_REGION = "us-east-1"  # 利用可能なリージョンに変更してください
+# Claude 3 Haiku のモデル ID
+DEFAULT_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+DEFAULT_CONCURRENCY = 4
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_bedrock_client(region_name=DEFAULT_REGION, max_pool_connections=10):
+    """Bedrock Runtime クライアントを取得（同じ設定のクライアントはプロセス内で再利用）
+
+    boto3 のクライアントはスレッドセーフなため、1つのクライアントの接続プールを
+    全スレッドで共有し、呼び出しごとのクライアント作成と TLS ハンドシェイクを避ける。
+    """
+    key = (region_name, max_pool_connections)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = boto3.client(
+                service_name='bedrock-runtime',
+                region_name=region_name,
+                config=Config(
+                    max_pool_connections=max_pool_connections,
+                    retries={"mode": "adaptive", "max_attempts": 5}
+                )
+            )
+        return _clients[key]
+
+
+def call_claude_bedrock(prompt, max_tokens=1000, model_id=DEFAULT_MODEL_ID, client=None, temperature=None):
     """
     Amazon Bedrock の Claude を呼び出すシンプルな関数
-    
+
     Args:
         prompt (str): Claude に送信するプロンプト
         max_tokens (int): 最大トークン数
-    
+        model_id (str): モデル ID
+        client: Bedrock Runtime クライアント（省略時は共有クライアント）
+        temperature (float): temperature（省略時はモデルのデフォルト）
+
     Returns:
         str: Claude からの応答
     """
-    
-    # Bedrock Runtime クライアントを作成
-    bedrock_runtime = boto3.client(
-        service_name='bedrock-runtime',
-        region_name='us-east-1'  # 利用可能なリージョンに変更してください
-    )
-    
-    # Claude 3 Haiku のモデル ID
-    model_id = "anthropic.claude-3-haiku-20240307-v1:0"
-    
-    # リクエストボディを作成
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    }
-    
+    provider = BedrockConverseProvider(client or get_bedrock_client())
+
     try:
-        # Bedrock API を呼び出し
-        response = bedrock_runtime.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body),
-            contentType='application/json'
-        )
-        
-        # レスポンスを解析
-        response_body = json.loads(response['body'].read())
-        
-        # Claude の応答テキストを取得
-        return response_body['content'][0]['text']
-        
+        return provider.complete(model_id, prompt, max_tokens, temperature)['text']
+
     except Exception as e:
         print(f"エラーが発生しました: {e}")
         return None
 
+
+def read_prompts(lines):
+    """入力行からプロンプトのリストを作成（空行は無視）"""
+    prompts = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = line
+        if not isinstance(item, dict):
+            item = {"prompt": item if isinstance(item, str) else line}
+        if "prompt" not in item:
+            raise ValueError(f"prompt がありません: {line[:80]}")
+        item.setdefault("id", len(prompts))
+        prompts.append(item)
+    return prompts
+
+
+def run_prompt(client, item, model_id=DEFAULT_MODEL_ID, max_tokens=1000, temperature=None, on_chunk=None):
+    """1件のプロンプトをストリーミングで実行し、結果を辞書で返す（エラーも結果に含める）"""
+    provider = BedrockConverseProvider(client)
+    status = {}
+    text = ""
+    first_token_latency = None
+    error = None
+    start = time.monotonic()
+    try:
+        for chunk in provider.stream(
+            item.get("model_id", model_id),
+            item["prompt"],
+            item.get("max_tokens", max_tokens),
+            item.get("temperature", temperature),
+            status
+        ):
+            if first_token_latency is None:
+                first_token_latency = time.monotonic() - start
+            text += chunk
+            if on_chunk:
+                on_chunk(item, chunk)
+    except Exception as e:
+        error = str(e)
+    return {
+        "id": item["id"],
+        "model_id": item.get("model_id", model_id),
+        "text": text,
+        "usage": status.get("usage", {}),
+        "stop_reason": status.get("stop_reason"),
+        "latency": round(time.monotonic() - start, 3),
+        "first_token_latency": round(first_token_latency, 3) if first_token_latency is not None else None,
+        "error": error
+    }
+
+
+def run_prompts(prompts, concurrency=DEFAULT_CONCURRENCY, client=None, model_id=DEFAULT_MODEL_ID,
+                max_tokens=1000, temperature=None, on_chunk=None):
+    """複数のプロンプトを同時実行数を制限して並列に実行し、結果を入力順に返す（ジェネレーター）"""
+    if client is None:
+        client = get_bedrock_client(max_pool_connections=max(concurrency, 10))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(run_prompt, client, item, model_id, max_tokens, temperature, on_chunk)
+            for item in prompts
+        ]
+        for future in futures:
+            yield future.result()
+
+
+class ChunkPrinter:
+    """ストリーミング中の応答を行単位で標準エラー出力に表示（並列時は行頭に ID を付ける）"""
+
+    def __init__(self, prefix_ids, output=sys.stderr):
+        self.prefix_ids = prefix_ids
+        self.output = output
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, item, chunk):
+        with self._lock:
+            buffer = self._buffers.get(item["id"], "") + chunk
+            *lines, buffer = buffer.split("\n")
+            self._buffers[item["id"]] = buffer
+            for line in lines:
+                self._write(item["id"], line)
+
+    def _write(self, item_id, line):
+        prefix = f"[{item_id}] " if self.prefix_ids else ""
+        self.output.write(prefix + line + "\n")
+        self.output.flush()
+
+    def flush(self, item_id):
+        with self._lock:
+            buffer = self._buffers.pop(item_id, "")
+            if buffer:
+                self._write(item_id, buffer)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Amazon Bedrock の Claude にプロンプトを一括送信")
+    parser.add_argument("--input", help="プロンプトの JSONL ファイル（省略時は標準入力）")
+    parser.add_argument("--output", help="結果の JSONL ファイル（省略時は標準出力）")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="同時実行数")
+    parser.add_argument("--model-id", default=DEFAULT_MODEL_ID, help="モデル ID")
+    parser.add_argument("--max-tokens", type=int, default=1000, help="最大トークン数")
+    parser.add_argument("--temperature", type=float, help="temperature（省略時はモデルのデフォルト）")
+    parser.add_argument("--region", default=DEFAULT_REGION, help="リージョン")
+    parser.add_argument("--stream", action="store_true", help="生成中の応答を標準エラー出力に表示")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            prompts = read_prompts(f)
+    else:
+        prompts = read_prompts(sys.stdin)
+    if not prompts:
+        parser.error("プロンプトがありません")
+
+    client = get_bedrock_client(args.region, max(args.concurrency, 10))
+    printer = ChunkPrinter(prefix_ids=args.concurrency > 1) if args.stream else None
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    errors = 0
+    try:
+        for result in run_prompts(
+            prompts, args.concurrency, client, args.model_id,
+            args.max_tokens, args.temperature, printer
+        ):
+            if printer:
+                printer.flush(result["id"])
+            if result["error"]:
+                errors += 1
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+    return 1 if errors else 0
+
 # 使用例
 if __name__ == "__main__":
+    if len(sys.argv) > 1 or not sys.stdin.isatty():
+        sys.exit(main())
+
     # プロンプトを設定
     user_prompt = "こんにちは！今日の天気について教えてください。"
-    
+
     # Claude を呼び出し
     print("Claude に質問中...")
     response = call_claude_bedrock(user_prompt)
-    
+
     if response:
         print("\nClaude の応答:")
         print(response)
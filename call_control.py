@@ -0,0 +1,180 @@
+import os
+import queue
+import socket
+import threading
+import time
+
+# プロセス全体で同時に実行するモデル呼び出しの上限
+MAX_CONCURRENT_CALLS = int(os.environ.get("RINGI_MAX_CONCURRENT_CALLS", 16))
+
+_DONE = object()
+
+
+class CallSlots:
+    """プロセス全体で共有するモデル呼び出しの同時実行枠"""
+
+    def __init__(self, limit=MAX_CONCURRENT_CALLS):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def acquire(self, cancel_event=None, poll_interval=0.2):
+        """枠を確保（中止された場合は False）"""
+        while not self._semaphore.acquire(timeout=poll_interval):
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+        with self._lock:
+            self.in_use += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+        self._semaphore.release()
+
+
+class CancellationStats:
+    """中止した呼び出しと、それによって生成を回避したトークン数の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cancelled_calls = 0
+        self.generated_tokens = 0
+        self.avoided_tokens = 0
+
+    def record(self, generated_tokens, avoided_tokens):
+        with self._lock:
+            self.cancelled_calls += 1
+            self.generated_tokens += generated_tokens
+            self.avoided_tokens += avoided_tokens
+
+
+def _close_quietly(response):
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+def interrupt_response(response):
+    """別スレッドで読み出し中のレスポンスを打ち切る
+
+    ブロック中の読み出しは close() では戻らないため、ソケットを shutdown して読み出しを
+    終わらせてから閉じる。close() は読み出し中のスレッドを待つことがあるため別スレッドで行う。
+    """
+    fileno = getattr(response, 'fileno', None)
+    if fileno is not None:
+        try:
+            sock = socket.socket(fileno=socket.dup(fileno()))
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            finally:
+                sock.close()
+        except (OSError, ValueError):
+            pass
+    threading.Thread(target=_close_quietly, args=(response,), daemon=True).start()
+
+
+class CancellableCall:
+    """モデル呼び出しのストリームを別スレッドで読み出し、途中で中止できるようにする
+
+    読み出し側は poll_interval ごとに None（待機中）を受け取るため、
+    応答待ちの間も定期的に処理を挟める。stream_factory(call) はこの呼び出しを受け取り、
+    開いたレスポンスを call.attach() で登録する。cancel() を呼ぶと登録済みのレスポンスを
+    直接閉じるため、最初のトークンを待っている読み出しも即座に打ち切られ、同時実行枠を解放する。
+    """
+
+    def __init__(self, stream_factory, slots, poll_interval=0.2, thread_setup=None):
+        self.cancel_event = threading.Event()
+        self.text = ""
+        self.finished = False
+        self.waiting_for_slot = True
+        self.started_at = time.monotonic()
+        self._stream_factory = stream_factory
+        self._slots = slots
+        self._poll_interval = poll_interval
+        self._thread_setup = thread_setup
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._responses = []
+        self._holds_slot = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def attach(self, response):
+        """中止時に閉じるレスポンス（close() と、あれば fileno() を持つオブジェクト）を登録"""
+        with self._lock:
+            if not self.cancel_event.is_set():
+                self._responses.append(response)
+                return
+        # 登録前に中止されていた場合はすぐに閉じる
+        interrupt_response(response)
+
+    def cancel(self):
+        """呼び出しを中止（完了済みの場合は何もしない）"""
+        if self.finished:
+            return
+        with self._lock:
+            self.cancel_event.set()
+            responses, self._responses = self._responses, []
+        for response in responses:
+            interrupt_response(response)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            if not self._holds_slot:
+                return
+            self._holds_slot = False
+        self._slots.release()
+
+    def _run(self):
+        if self._thread_setup:
+            self._thread_setup()
+        if not self._slots.acquire(self.cancel_event):
+            self._queue.put(_DONE)
+            return
+        with self._lock:
+            self._holds_slot = True
+        self.waiting_for_slot = False
+        try:
+            if self.cancel_event.is_set():
+                return
+            stream = self._stream_factory(self)
+            try:
+                for chunk in stream:
+                    if self.cancel_event.is_set():
+                        break
+                    self._queue.put(chunk)
+            except Exception:
+                # 中止で閉じたレスポンスの読み出しエラーは無視する
+                if not self.cancel_event.is_set():
+                    raise
+            finally:
+                stream.close()
+        finally:
+            self._release_slot()
+            self._queue.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._poll_interval)
+            except queue.Empty:
+                if self.cancel_event.is_set():
+                    return
+                yield None
+                continue
+            if item is _DONE:
+                self.finished = True
+                return
+            self.text += item
+            yield item
@@ -0,0 +1,165 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+
+# チェック項目プロファイルの保存先（1プロファイル = 1 JSON ファイル）
+DEFAULT_PROFILE_DIR = os.environ.get("RINGI_PROFILE_DIR", "check_item_profiles")
+DEFAULT_PROFILE = "共通"
+
+_SUFFIX = ".json"
+_HISTORY_DIR = "history"
+
+
+class ProfileConflictError(Exception):
+    """編集開始後に他のセッションがプロファイルを更新していた"""
+
+
+class ProfileLoadError(Exception):
+    """プロファイルのファイルが壊れている・読み込めない"""
+
+
+class CheckItemProfileStore:
+    """部署ごとのチェック項目プロファイルを版管理して保存するストア
+
+    現在の版は <ディレクトリ>/<プロファイル名>.json、過去の版は history/ 以下に保存する。
+    読み込んだプロファイルはプロセス内でキャッシュし、ファイルの更新時刻・サイズが
+    変わった場合のみ読み直す（内容のハッシュが同じなら解析済みの値を使い続ける）。
+    返すチェック項目は全セッションで共有するため、呼び出し側で変更しないこと。
+    """
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR, default_items=None):
+        self.directory = directory
+        self.default_items = default_items
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._default_profile = None
+        os.makedirs(os.path.join(directory, _HISTORY_DIR), exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, quote(name, safe="") + _SUFFIX)
+
+    def _history_path(self, name, version):
+        return os.path.join(self.directory, _HISTORY_DIR, f"{quote(name, safe='')}.v{version}{_SUFFIX}")
+
+    def list_profiles(self):
+        """保存済みのプロファイル名の一覧"""
+        return sorted(
+            unquote(filename[:-len(_SUFFIX)])
+            for filename in os.listdir(self.directory)
+            if filename.endswith(_SUFFIX)
+        )
+
+    def default_profile(self, name):
+        """デフォルトのチェック項目による版 0 のプロファイル（デフォルトがなければ None）"""
+        if self.default_items is None:
+            return None
+        if self._default_profile is None:
+            self._default_profile = {
+                'version': 0,
+                'updated_at': None,
+                'check_items': copy.deepcopy(self.default_items),
+                'hash': None
+            }
+        return {**self._default_profile, 'name': name}
+
+    def get(self, name):
+        """プロファイルを取得（未保存の場合はデフォルトの版 0、デフォルトもなければ None）
+
+        ファイルが壊れている・読み込めない場合は ProfileLoadError を送出する。
+
+        Returns:
+            dict: name, version, updated_at, check_items, hash
+        """
+        path = self._path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._cache.pop(name, None)
+            return self.default_profile(name)
+
+        with self._lock:
+            cached = self._cache.get(name)
+        if cached and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+            return cached['profile']
+
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()
+            if cached and cached['profile']['hash'] == digest:
+                profile = cached['profile']
+            else:
+                data = json.loads(raw.decode('utf-8'))
+                profile = {
+                    'name': name,
+                    'version': int(data['version']),
+                    'updated_at': data.get('updated_at'),
+                    'check_items': dict(data['check_items']),
+                    'hash': digest
+                }
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise ProfileLoadError(f"プロファイル「{name}」を読み込めません: {e}") from e
+        with self._lock:
+            self._cache[name] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'profile': profile}
+        return profile
+
+    def save(self, name, check_items, base_version=None):
+        """新しい版として保存し、保存後のプロファイルを返す
+
+        base_version を指定した場合、現在の版と異なれば ProfileConflictError を送出する。
+        現在のファイルが壊れている場合は、保存済みの最新の版の次の版として置き換える。
+        """
+        with self._lock:
+            try:
+                current = self.get(name)
+            except ProfileLoadError:
+                current = None
+                base_version = None
+                current_version = max(self.versions(name), default=0)
+            else:
+                current_version = current['version'] if current else 0
+            if base_version is not None and base_version != current_version:
+                raise ProfileConflictError(
+                    f"プロファイル「{name}」は他の編集で版 {current_version} に更新されています"
+                )
+            version = current_version + 1
+            data = {
+                'version': version,
+                'updated_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'check_items': check_items
+            }
+            raw = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+            # 書き込み途中のファイルを読まれないよう、一時ファイルから置き換える
+            for path in (self._history_path(name, version), self._path(name)):
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(raw)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+        return self.get(name)
+
+    def versions(self, name):
+        """保存済みの版の一覧（新しい順）"""
+        prefix = quote(name, safe="") + ".v"
+        history_dir = os.path.join(self.directory, _HISTORY_DIR)
+        versions = []
+        for filename in os.listdir(history_dir):
+            if filename.startswith(prefix) and filename.endswith(_SUFFIX):
+                version = filename[len(prefix):-len(_SUFFIX)]
+                if version.isdigit():
+                    versions.append(int(version))
+        return sorted(versions, reverse=True)
+
+    def get_version(self, name, version):
+        """過去の版のチェック項目を取得（読み込めない場合は ProfileLoadError）"""
+        try:
+            with open(self._history_path(name, version), encoding='utf-8') as f:
+                return dict(json.load(f)['check_items'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise ProfileLoadError(f"プロファイル「{name}」の版 {version} を読み込めません: {e}") from e
@@ -0,0 +1,111 @@
+import re
+import statistics
+from collections import Counter
+
+from stream_parser import ReportStreamParser
+
+# 不安定とみなすばらつきのしきい値
+SCORE_SPREAD_THRESHOLD = 10
+RATING_SPREAD_THRESHOLD = 2
+APPROVAL_AGREEMENT_THRESHOLD = 2 / 3
+# 承認可否の同票時は慎重な判定を優先する（× > △ > ○）
+_APPROVAL_PRIORITY = "×△○"
+
+_CATEGORY_POINTS_RE = re.compile(
+    r'^###\s*(?P<category>.+?)\s*[（(]\s*(?P<points>\d+)\s*/\s*(?P<max>\d+)\s*点\s*[)）]',
+    re.MULTILINE
+)
+
+
+def parse_report(text, categories):
+    """チェック結果から評価点数・承認可否・カテゴリ別評価と配点を抽出"""
+    parser = ReportStreamParser(categories)
+    parser.feed(text)
+    parser.close()
+    category_points = {
+        match.group('category').strip(): int(match.group('points'))
+        for match in _CATEGORY_POINTS_RE.finditer(text)
+        if match.group('category').strip() in categories
+    }
+    return {
+        'text': text,
+        'score': parser.score,
+        'approval': parser.approval,
+        'ratings': dict(parser.category_ratings),
+        'category_points': category_points
+    }
+
+
+def _spread(values):
+    return max(values) - min(values) if values else 0
+
+
+def _median_by_key(reports, key):
+    names = []
+    for report in reports:
+        names.extend(name for name in report[key] if name not in names)
+    result = {}
+    for name in names:
+        values = [report[key][name] for report in reports if name in report[key]]
+        result[name] = {
+            'median': statistics.median(values),
+            'spread': _spread(values),
+            'samples': len(values)
+        }
+    return result
+
+
+def aggregate_reports(reports):
+    """複数サンプルの評価を中央値・ばらつき・多数決で集計し、不安定な判定を検出
+
+    承認可否が同票の場合は慎重な判定（× > △ > ○）を、評価点数は低い方の中央値を採用する。
+    """
+    reports = [report for report in reports if report]
+    scores = [report['score'] for report in reports if report['score'] is not None]
+    approvals = [report['approval'] for report in reports if report['approval']]
+
+    approval = None
+    agreement = 0.0
+    if approvals:
+        counts = Counter(approvals)
+        approval = min(counts, key=lambda value: (-counts[value], _APPROVAL_PRIORITY.index(value)))
+        agreement = counts[approval] / len(approvals)
+
+    ratings = _median_by_key(reports, 'ratings')
+    category_points = _median_by_key(reports, 'category_points')
+
+    unstable = []
+    if _spread(scores) >= SCORE_SPREAD_THRESHOLD:
+        unstable.append(f"評価点数のばらつきが大きい（{min(scores)}〜{max(scores)}点）")
+    if approvals and agreement < APPROVAL_AGREEMENT_THRESHOLD:
+        unstable.append(f"承認可否が一致しない（{dict(Counter(approvals))}）")
+    for category, stats in ratings.items():
+        if stats['spread'] >= RATING_SPREAD_THRESHOLD:
+            unstable.append(f"{category}の評価が不安定（幅 {stats['spread']:g}）")
+
+    # 偶数サンプルでは低い方の中央値を採用し、点数を整数（実際のサンプルの値）に保つ
+    median_score = statistics.median_low(scores) if scores else None
+
+    # 中央値に最も近く多数決と一致するサンプルを代表レポートとする
+    representative = None
+    candidates = [r for r in reports if r['score'] is not None and r['approval'] == approval] or reports
+    if candidates:
+        representative = min(
+            candidates,
+            key=lambda r: abs(r['score'] - median_score) if r['score'] is not None and median_score is not None else 0
+        )
+
+    return {
+        'samples': len(reports),
+        'score': median_score,
+        'score_spread': _spread(scores),
+        'score_stdev': statistics.pstdev(scores) if len(scores) > 1 else 0.0,
+        'scores': scores,
+        'approval': approval,
+        'approval_agreement': agreement,
+        'approvals': approvals,
+        'ratings': ratings,
+        'category_points': category_points,
+        'unstable': unstable,
+        'representative': representative
+    }
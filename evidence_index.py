@@ -0,0 +1,176 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+# BM25 パラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 見出しの一致を本文より重視する重み
+TITLE_WEIGHT = 3
+
+DEFAULT_TOP_K = 3
+# これより長いセクションは段落単位で分割する
+MAX_SEGMENT_CHARS = 1200
+
+_BRACKET_HEADING_RE = re.compile(r'^\s*【(?P<title>[^】]+)】')
+_CHAPTER_HEADING_RE = re.compile(r'^\s*(?P<title>第\s*[0-9０-９一二三四五六七八九十]+\s*[章節条]\s*\S.{0,40})$')
+_NUMBERED_HEADING_RE = re.compile(
+    r'^\s*(?P<title>(?:[0-9０-９]{1,2}[\.．](?![0-9０-９])'
+    r'|[（(][0-9０-９]{1,2}[)）]'
+    r'|[一二三四五六七八九十]{1,3}[、．.]'
+    r'|#{1,6}\s)\s*\S.{0,40})$'
+)
+_PAGE_CONTINUED = "（続き）"
+
+
+def normalize(text):
+    """検索用に正規化（全角半角・大文字小文字の統一、空白と記号の除去）"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(
+        ch for ch in text
+        if not unicodedata.category(ch).startswith(("Z", "P", "S", "C"))
+    )
+
+
+def bigrams(text):
+    """文字 bigram のリスト（1文字の場合はその文字）"""
+    text = normalize(text)
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _heading(line, numbered=True):
+    match = _BRACKET_HEADING_RE.match(line) or _CHAPTER_HEADING_RE.match(line)
+    if not match and numbered:
+        match = _NUMBERED_HEADING_RE.match(line)
+    return match.group('title').strip() if match else None
+
+
+def _split_long(lines, max_chars):
+    parts = []
+    current = []
+    length = 0
+    for line in lines:
+        if current and length + len(line) > max_chars:
+            parts.append(current)
+            current = []
+            length = 0
+        current.append(line)
+        length += len(line) + 1
+    if current:
+        parts.append(current)
+    return parts
+
+
+def segment_pages(pages, max_chars=MAX_SEGMENT_CHARS):
+    """【…】見出しや番号付きの見出しでページのテキストをセクションに分割
+
+    ページをまたぐセクションはページごとに分け、見出しを引き継ぐ。
+    【…】見出しがある文書では、番号付きの行は見出しではなく箇条書きとして扱う。
+
+    Args:
+        pages (list): ページごとのテキスト（ページ情報がない場合は全文1要素のリスト）
+
+    Returns:
+        list: セクション（id, title, page, text）のリスト
+    """
+    segments = []
+    title = "冒頭"
+    numbered = not any(_BRACKET_HEADING_RE.match(line) for page_text in pages for line in page_text.splitlines())
+    for page_number, page_text in enumerate(pages, start=1):
+        sections = []
+        current_title = title + _PAGE_CONTINUED if page_number > 1 and segments else title
+        current = []
+        for line in page_text.splitlines():
+            heading = _heading(line, numbered)
+            if heading:
+                if any(l.strip() for l in current):
+                    sections.append((current_title, current))
+                title = current_title = heading
+                current = [line]
+            else:
+                current.append(line)
+        if any(l.strip() for l in current):
+            sections.append((current_title, current))
+
+        for section_title, lines in sections:
+            lines = [line for line in lines if line.strip()]
+            for part in _split_long(lines, max_chars):
+                segments.append({
+                    'id': f"S{len(segments) + 1}",
+                    'title': section_title,
+                    'page': page_number if len(pages) > 1 else None,
+                    'text': "\n".join(part)
+                })
+    return segments
+
+
+class EvidenceIndex:
+    """セクションに対する文字 bigram の BM25 検索"""
+
+    def __init__(self, segments):
+        self.segments = segments
+        self._terms = []
+        document_frequency = Counter()
+        for segment in segments:
+            terms = Counter(bigrams(segment['text']))
+            for term in bigrams(segment['title']):
+                terms[term] += TITLE_WEIGHT
+            self._terms.append(terms)
+            document_frequency.update(terms.keys())
+        self._lengths = [sum(terms.values()) for terms in self._terms]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0
+        count = len(segments)
+        self._idf = {
+            term: math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def score(self, query_terms, i):
+        terms = self._terms[i]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / self._avg_length)
+        score = 0.0
+        for term in query_terms:
+            tf = terms.get(term)
+            if tf:
+                score += self._idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        return score
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """クエリに関連するセクションを上位 k 件（スコア 0 は除く）"""
+        query_terms = set(bigrams(query))
+        scored = [(self.score(query_terms, i), i) for i in range(len(self.segments))]
+        scored = sorted((item for item in scored if item[0] > 0), reverse=True)[:k]
+        return [(self.segments[i], score) for score, i in scored]
+
+
+def select_evidence(pages, check_items, k=DEFAULT_TOP_K):
+    """チェック観点ごとに関連するセクションを選択
+
+    Returns:
+        tuple: (抜粋に含めるセクションのリスト（文書順）, {カテゴリ: [セクション ID]})
+    """
+    index = EvidenceIndex(segment_pages(pages))
+    assignments = {}
+    selected = set()
+    for category, items in check_items.items():
+        results = index.search(category + "\n" + "\n".join(items), k)
+        assignments[category] = [segment['id'] for segment, _ in results]
+        selected.update(assignments[category])
+    segments = [segment for segment in index.segments if segment['id'] in selected]
+    return segments, assignments
+
+
+def format_evidence(segments, assignments):
+    """選択したセクションをプロンプト用に整形（セクション ID・見出し・ページ付き）"""
+    parts = []
+    for segment in segments:
+        page = f"（p.{segment['page']}）" if segment['page'] else ""
+        parts.append(f"[{segment['id']}] {segment['title']}{page}\n{segment['text']}")
+    lines = [
+        f"- {category}: {', '.join(ids) if ids else '該当箇所なし'}"
+        for category, ids in assignments.items()
+    ]
+    return "\n\n".join(parts) + "\n\n【チェック観点ごとの関連箇所】\n" + "\n".join(lines) + "\n"
@@ -0,0 +1,297 @@
+"""稟議書チェッカーの負荷試験ツール
+
+ローカルの疑似 Bedrock エンドポイントを起動し、Streamlit の AppTest で
+複数の同時セッションを模擬してチェック処理を実行する。
+同時セッション数ごとのスループット・レイテンシ（p50/p95/p99）・
+セッションあたりのメモリ使用量を計測し、飽和点を報告する。
+
+使用例:
+    python load_test.py --sessions 1,2,4,8,16 --checks 3 --latency 1.0 --tps 80
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from model_selector import percentile
+from pdf_extraction import current_rss_bytes
+
+SAMPLE_RINGI = """件名: 新規CRMシステム導入に関する稟議
+
+申請者: 営業部 田中太郎
+申請日: 2024年6月20日
+承認者: 営業部長、IT部長、取締役
+
+【目的】
+顧客管理の効率化と営業活動の最適化を図るため、新規CRMシステムを導入したい。
+
+【導入予定システム】
+- 初期費用: 500万円
+- 月額費用: 50万円（100ユーザー）
+
+【スケジュール】
+- 2024年7月: システム選定完了
+- 2024年10月: 運用開始
+"""
+
+# スループットの伸びがこの割合未満になった時点を飽和とみなす
+SATURATION_GAIN = 0.1
+
+
+def encode_event(headers, payload):
+    """AWS イベントストリーム形式のメッセージを作成"""
+    header_bytes = b""
+    for name, value in headers.items():
+        name_bytes = name.encode("utf-8")
+        value_bytes = value.encode("utf-8")
+        header_bytes += struct.pack("B", len(name_bytes)) + name_bytes
+        header_bytes += struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+    total_length = 12 + len(header_bytes) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(header_bytes))
+    prelude += struct.pack(">I", zlib.crc32(prelude))
+    message = prelude + header_bytes + payload
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+def fake_report(categories):
+    """チェック結果の出力形式に沿った疑似レポートを作成"""
+    score = random.randint(55, 90)
+    approval = "○" if score >= 80 else "△" if score >= 60 else "×"
+    lines = [
+        "## 📊 総合評価・最終判定",
+        f"- **評価点数**: {score}/100点",
+        f"- **承認可否**: {approval}（負荷試験）",
+        "- **判定理由**: 負荷試験用の疑似応答です",
+        "",
+        "### 📈 カテゴリ別評価（5段階）"
+    ]
+    for category in categories:
+        rating = random.randint(2, 5)
+        lines.append(f"- **{category}**: {'⭐' * rating} ({rating}/5) - 疑似評価")
+    lines += ["", "## ✅ 良い点", "- 疑似応答"]
+    for category in categories:
+        lines += [f"### {category} (15/20点)", "**評価根拠**:", "- " + "疑似的な評価根拠です。" * 20, ""]
+    return "\n".join(lines)
+
+
+class FakeBedrockHandler(BaseHTTPRequestHandler):
+    """Bedrock Runtime の Converse / ConverseStream API を模擬"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 1.0
+    tokens_per_second = 80.0
+    output_tokens = 800
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_request(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        request = json.loads(body or b"{}")
+        prompt = "".join(
+            block.get("text", "")
+            for message in request.get("messages", [])
+            for block in message.get("content", [])
+        )
+        categories = []
+        for line in prompt.splitlines():
+            if "(X/5)" in line and "**" in line:
+                categories.append(line.split("**")[1])
+        return prompt, categories or ["基本情報", "内容・目的", "予算・コスト"]
+
+    def _text_chunks(self, text):
+        """出力トークン数に合わせて応答を分割（1チャンク約20トークン）"""
+        text = (text * (self.output_tokens // max(len(text), 1) + 1))[:self.output_tokens]
+        return [text[i:i + 20] for i in range(0, len(text), 20)]
+
+    def do_POST(self):
+        start = time.monotonic()
+        prompt, categories = self._read_request()
+        chunks = self._text_chunks(fake_report(categories))
+        usage = {
+            "inputTokens": len(prompt),
+            "outputTokens": self.output_tokens,
+            "totalTokens": len(prompt) + self.output_tokens
+        }
+        time.sleep(self.latency)
+
+        if self.path.endswith("/converse"):
+            time.sleep(len(chunks) * 20 / self.tokens_per_second)
+            payload = json.dumps({
+                "output": {"message": {"role": "assistant", "content": [{"text": "".join(chunks)}]}},
+                "stopReason": "end_turn",
+                "usage": usage,
+                "metrics": {"latencyMs": int((time.monotonic() - start) * 1000)}
+            }, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_event("messageStart", {"role": "assistant"})
+        for chunk in chunks:
+            self._write_event("contentBlockDelta", {"contentBlockIndex": 0, "delta": {"text": chunk}})
+            time.sleep(20 / self.tokens_per_second)
+        self._write_event("contentBlockStop", {"contentBlockIndex": 0})
+        self._write_event("messageStop", {"stopReason": "end_turn"})
+        self._write_event("metadata", {
+            "usage": usage,
+            "metrics": {"latencyMs": int((time.monotonic() - start) * 1000)}
+        })
+        self._write_chunk(b"")
+
+    def _write_event(self, event_type, data):
+        self._write_chunk(encode_event({
+            ":event-type": event_type,
+            ":content-type": "application/json",
+            ":message-type": "event"
+        }, json.dumps(data, ensure_ascii=False).encode("utf-8")))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_fake_bedrock(latency, tokens_per_second, output_tokens):
+    """疑似 Bedrock エンドポイントをバックグラウンドで起動し、URL を返す"""
+    handler = type("ConfiguredFakeBedrockHandler", (FakeBedrockHandler,), {
+        "latency": latency,
+        "tokens_per_second": tokens_per_second,
+        "output_tokens": output_tokens
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _find(widgets, label):
+    return next(widget for widget in widgets if widget.label == label)
+
+
+def run_session(app_path, checks, timeout):
+    """1セッション分のチェックを実行し、各チェックのレイテンシ・エラー数・セッションを返す"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    at.run()
+    _find(at.checkbox, "過去のチェック結果を活用").uncheck()
+    _find(at.radio, "入力方法を選択").set_value("✏️ テキスト入力")
+    at.run()
+    _find(at.text_area, "稟議書の内容を入力してください").set_value(SAMPLE_RINGI)
+    at.run()
+
+    latencies = []
+    errors = 0
+    for _ in range(checks):
+        start = time.perf_counter()
+        _find(at.button, "🔍 稟議書を詳細チェック").click()
+        at.run()
+        latencies.append(time.perf_counter() - start)
+        if at.exception or any("取得できませんでした" in e.value for e in at.error):
+            errors += 1
+    return latencies, errors, at
+
+
+def run_level(app_path, sessions, checks, timeout):
+    """指定した同時セッション数で負荷をかけて計測"""
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(lambda _: run_session(app_path, checks, timeout), range(sessions)))
+    elapsed = time.perf_counter() - start
+    # セッション（AppTest）を保持したままメモリ使用量を計測する
+    rss_after = current_rss_bytes()
+
+    latencies = [latency for session_latencies, _, _ in results for latency in session_latencies]
+
+    return {
+        'sessions': sessions,
+        'checks': len(latencies),
+        'errors': sum(errors for _, errors, _ in results),
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'mean': statistics.mean(latencies),
+        'memory_per_session': max(0, rss_after - rss_before) / sessions
+    }
+
+
+def find_saturation(levels):
+    """スループットの伸びが止まった（またはエラーが出始めた）同時セッション数"""
+    for previous, current in zip(levels, levels[1:]):
+        gain = (current['throughput'] - previous['throughput']) / previous['throughput']
+        if gain < SATURATION_GAIN or current['errors'] > previous['errors']:
+            return previous['sessions']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="稟議書チェッカーの負荷試験")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "ringi_checker.py"),
+                        help="対象の Streamlit アプリ")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="同時セッション数（カンマ区切り）")
+    parser.add_argument("--checks", type=int, default=3, help="セッションあたりのチェック回数")
+    parser.add_argument("--latency", type=float, default=1.0, help="疑似 Bedrock の最初のトークンまでの秒数")
+    parser.add_argument("--tps", type=float, default=80.0, help="疑似 Bedrock の出力速度（トークン/秒）")
+    parser.add_argument("--output-tokens", type=int, default=800, help="疑似 Bedrock の出力トークン数")
+    parser.add_argument("--timeout", type=float, default=300, help="1回のチェックのタイムアウト（秒）")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    server, endpoint_url = start_fake_bedrock(args.latency, args.tps, args.output_tokens)
+    # チェック履歴・チェック項目プロファイルは一時ディレクトリに書き込み、実際のデータを汚さない
+    data_dir = tempfile.mkdtemp(prefix="ringi_load_")
+    os.environ.update({
+        "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": endpoint_url,
+        "AWS_ACCESS_KEY_ID": "load-test",
+        "AWS_SECRET_ACCESS_KEY": "load-test",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "RINGI_HISTORY_DB": os.path.join(data_dir, "history.db"),
+        "RINGI_PROFILE_DIR": os.path.join(data_dir, "check_item_profiles")
+    })
+    print(f"疑似 Bedrock: {endpoint_url} (遅延 {args.latency}秒, {args.tps}トークン/秒, {args.output_tokens}トークン)")
+
+    levels = []
+    print(f"{'同時':>4} {'件数':>4} {'エラー':>4} {'件/秒':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'MB/セッション':>12}")
+    try:
+        for sessions in [int(n) for n in args.sessions.split(",")]:
+            level = run_level(args.app, sessions, args.checks, args.timeout)
+            levels.append(level)
+            print(
+                f"{level['sessions']:>4} {level['checks']:>4} {level['errors']:>4} "
+                f"{level['throughput']:>7.2f} {level['p50']:>7.2f} {level['p95']:>7.2f} {level['p99']:>7.2f} "
+                f"{level['memory_per_session'] / (1024 * 1024):>12.1f}"
+            )
+    finally:
+        server.shutdown()
+
+    saturation = find_saturation(levels)
+    if saturation:
+        print(f"\n飽和点: 同時 {saturation} セッション（これ以上はスループットが伸びません）")
+    else:
+        print("\n飽和点: 計測範囲内では飽和していません")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({'levels': levels, 'saturation_sessions': saturation}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
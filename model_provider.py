@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+
+# ローカルの OpenAI 互換サーバー（llama.cpp server など）の設定
+LOCAL_LLM_BASE_URL = os.environ.get("LOCAL_LLM_BASE_URL")
+LOCAL_LLM_MODEL = os.environ.get("LOCAL_LLM_MODEL", "local-model")
+LOCAL_LLM_API_KEY = os.environ.get("LOCAL_LLM_API_KEY")
+LOCAL_LLM_TIMEOUT = float(os.environ.get("LOCAL_LLM_TIMEOUT", 600))
+LOCAL_LLM_CONTEXT = int(os.environ.get("LOCAL_LLM_CONTEXT", 8192))
+
+# OpenAI 互換 API の finish_reason を Converse API の stopReason に対応付け
+_OPENAI_STOP_REASONS = {
+    "stop": "end_turn",
+    "length": "max_tokens",
+    "content_filter": "content_filtered"
+}
+
+
+def local_model_config():
+    """ローカルバックエンドのモデル設定（LOCAL_LLM_BASE_URL 未設定時は None）"""
+    if not LOCAL_LLM_BASE_URL:
+        return None
+    return {
+        "model_id": LOCAL_LLM_MODEL,
+        "description": "ローカルCPUサーバー - 低コストの事前スクリーニング",
+        "max_tokens": 4000,
+        "context_window": LOCAL_LLM_CONTEXT,
+        "icon": "🖥️",
+        "provider": "Local"
+    }
+
+
+# ConverseStream の HTTP レスポンス（呼び出したスレッドごと。中止時にソケットを閉じるため）
+_stream_responses = threading.local()
+
+
+def _keep_stream_response(http_response, **kwargs):
+    _stream_responses.raw = http_response.raw
+
+
+class BedrockConverseProvider:
+    """Bedrock Converse / ConverseStream API によるモデル呼び出し
+
+    Converse API はモデル間で共通のリクエスト形式のため、
+    Claude・Nova などモデルごとのリクエストボディの違いを意識せずに呼び出せる。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        # 同じ unique_id の登録は一度だけ有効になる
+        client.meta.events.register(
+            "after-call.bedrock-runtime.ConverseStream", _keep_stream_response,
+            unique_id="ringi-checker-stream-response"
+        )
+
+    def _request(self, model_id, prompt, max_tokens, temperature):
+        # temperature が None の場合はモデルのデフォルトを使う
+        inference_config = {"maxTokens": max_tokens}
+        if temperature is not None:
+            inference_config["temperature"] = temperature
+        return {
+            "modelId": model_id,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"text": prompt}]
+                }
+            ],
+            "inferenceConfig": inference_config
+        }
+
+    def complete(self, model_id, prompt, max_tokens=4000, temperature=0.3):
+        """応答全体を取得
+
+        Returns:
+            dict: text（応答テキスト）, usage（トークン数）, stop_reason（停止理由）, latency（秒）
+        """
+        start = time.monotonic()
+        response = self.client.converse(**self._request(model_id, prompt, max_tokens, temperature))
+        content = response['output']['message']['content']
+        return {
+            'text': "".join(block.get('text', "") for block in content),
+            'usage': response.get('usage', {}),
+            'stop_reason': response.get('stopReason'),
+            'latency': time.monotonic() - start
+        }
+
+    def stream(self, model_id, prompt, max_tokens=4000, temperature=0.3, status=None, on_open=None):
+        """応答テキストの断片を順に返す
+
+        status を指定すると usage・stop_reason を格納する。
+        ジェネレーターを close するとストリームを閉じて生成を打ち切る。
+        on_open を指定すると、開いた HTTP レスポンスを渡す（別スレッドから中止するため）。
+        """
+        if status is None:
+            status = {}
+        _stream_responses.raw = None
+        response = self.client.converse_stream(**self._request(model_id, prompt, max_tokens, temperature))
+        stream = response['stream']
+        if on_open is not None:
+            on_open(_stream_responses.raw or stream)
+        try:
+            for event in stream:
+                if 'contentBlockDelta' in event:
+                    text = event['contentBlockDelta']['delta'].get('text')
+                    if text:
+                        yield text
+                elif 'messageStop' in event:
+                    status['stop_reason'] = event['messageStop'].get('stopReason')
+                elif 'metadata' in event:
+                    status['usage'] = event['metadata'].get('usage', {})
+        finally:
+            stream.close()
+
+
+class OpenAICompatibleProvider:
+    """OpenAI 互換の Chat Completions API（llama.cpp server など）によるモデル呼び出し"""
+
+    def __init__(self, base_url, api_key=None, timeout=LOCAL_LLM_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _open(self, model_id, prompt, max_tokens, temperature, stream):
+        body = {
+            "model": model_id,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream
+        }
+        if stream:
+            body["stream_options"] = {"include_usage": True}
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(
+            f"{self.base_url}/v1/chat/completions",
+            data=json.dumps(body).encode("utf-8"),
+            headers=headers,
+            method="POST"
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    @staticmethod
+    def _usage(usage):
+        if not usage:
+            return {}
+        return {
+            'inputTokens': usage.get('prompt_tokens'),
+            'outputTokens': usage.get('completion_tokens'),
+            'totalTokens': usage.get('total_tokens')
+        }
+
+    def complete(self, model_id, prompt, max_tokens=4000, temperature=0.3):
+        """応答全体を取得（戻り値は BedrockConverseProvider.complete と同じ形式）"""
+        start = time.monotonic()
+        with self._open(model_id, prompt, max_tokens, temperature, stream=False) as response:
+            data = json.loads(response.read())
+        choice = data['choices'][0]
+        return {
+            'text': choice['message'].get('content') or "",
+            'usage': self._usage(data.get('usage')),
+            'stop_reason': _OPENAI_STOP_REASONS.get(choice.get('finish_reason'), choice.get('finish_reason')),
+            'latency': time.monotonic() - start
+        }
+
+    def stream(self, model_id, prompt, max_tokens=4000, temperature=0.3, status=None, on_open=None):
+        """応答テキストの断片を順に返す（Server-Sent Events、on_open は BedrockConverseProvider.stream と同じ）"""
+        if status is None:
+            status = {}
+        response = self._open(model_id, prompt, max_tokens, temperature, stream=True)
+        if on_open is not None:
+            on_open(response)
+        try:
+            for line in response:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if event.get('usage'):
+                    status['usage'] = self._usage(event['usage'])
+                for choice in event.get('choices', []):
+                    text = choice.get('delta', {}).get('content')
+                    if text:
+                        yield text
+                    if choice.get('finish_reason'):
+                        status['stop_reason'] = _OPENAI_STOP_REASONS.get(
+                            choice['finish_reason'], choice['finish_reason']
+                        )
+        finally:
+            response.close()
+
+
+def get_provider(provider_name, bedrock_client):
+    """MODELS の provider に対応する呼び出しバックエンドを取得"""
+    if provider_name == "Local":
+        if not LOCAL_LLM_BASE_URL:
+            raise ValueError("LOCAL_LLM_BASE_URL が設定されていません")
+        return OpenAICompatibleProvider(LOCAL_LLM_BASE_URL, LOCAL_LLM_API_KEY)
+    if provider_name in ("Anthropic", "Amazon"):
+        return BedrockConverseProvider(bedrock_client)
+    raise ValueError(f"サポートされていないプロバイダー: {provider_name}")
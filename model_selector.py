@@ -0,0 +1,152 @@
+import math
+import threading
+import time
+from collections import deque
+
+# ティアごとの目標レイテンシ（秒、p95）。None は制限なし
+TIER_SLA_SECONDS = {
+    "fast": 20,
+    "balanced": 60,
+    "thorough": None
+}
+TIER_LABELS = {
+    "fast": "⚡ 高速",
+    "balanced": "⚖️ バランス",
+    "thorough": "🧠 高精度"
+}
+
+# 劣化とみなすしきい値
+MIN_SAMPLES = 5
+ERROR_RATE_THRESHOLD = 0.3
+THROTTLE_RATE_THRESHOLD = 0.2
+THROTTLE_COOLDOWN_SECONDS = 60
+
+# ConverseStream の途中で返るエラーは先頭が小文字（throttlingException など）のため、大文字小文字を区別せずに比較する
+THROTTLING_ERROR_CODES = {
+    "throttlingexception",
+    "toomanyrequestsexception",
+    "servicequotaexceededexception",
+    "serviceunavailableexception",
+    "modelnotreadyexception"
+}
+
+
+def error_code(error):
+    """boto3 の例外からエラーコードを取得"""
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") or type(error).__name__
+
+
+def is_throttling_error(error):
+    """スロットリング・一時的な利用不可を示すエラーか"""
+    return error_code(error).lower() in THROTTLING_ERROR_CODES
+
+
+def percentile(values, pct):
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class ModelSelector:
+    """モデルごとの実測レイテンシ・エラー率・スロットリング率に基づくモデル選択
+
+    直近の呼び出し結果をモデル ID ごとにローリングウィンドウで保持し、
+    ティアまたは目標レイテンシを満たす中で最も高精度な正常モデルを選ぶ。
+    """
+
+    def __init__(self, window=200, window_seconds=1800):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._window = window
+        self._calls = {}
+
+    def record(self, model_id, latency, outcome="ok", first_token_latency=None, output_tokens=None):
+        """呼び出し結果を記録（outcome は "ok" / "error" / "throttled"）"""
+        with self._lock:
+            calls = self._calls.setdefault(model_id, deque(maxlen=self._window))
+            calls.append({
+                'time': time.time(),
+                'latency': latency,
+                'outcome': outcome,
+                'first_token_latency': first_token_latency,
+                'output_tokens': output_tokens
+            })
+
+    def _recent(self, model_id):
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            return [call for call in self._calls.get(model_id, ()) if call['time'] >= cutoff]
+
+    def stats(self, model_id):
+        """モデルの直近の統計（レイテンシのパーセンタイル・エラー率など）"""
+        calls = self._recent(model_id)
+        latencies = [call['latency'] for call in calls if call['outcome'] == "ok"]
+        first_tokens = [
+            call['first_token_latency'] for call in calls
+            if call['outcome'] == "ok" and call['first_token_latency'] is not None
+        ]
+        output_tokens = [
+            call['output_tokens'] for call in calls
+            if call['outcome'] == "ok" and call['output_tokens']
+        ]
+        throttled = [call for call in calls if call['outcome'] == "throttled"]
+        errors = [call for call in calls if call['outcome'] == "error"]
+        return {
+            'calls': len(calls),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'first_token_p50': percentile(first_tokens, 50),
+            'avg_output_tokens': sum(output_tokens) / len(output_tokens) if output_tokens else None,
+            'error_rate': len(errors) / len(calls) if calls else 0.0,
+            'throttle_rate': len(throttled) / len(calls) if calls else 0.0,
+            'last_throttled': max((call['time'] for call in throttled), default=None)
+        }
+
+    def health(self, model_id):
+        """モデルの状態（"healthy" / "degraded" / "throttled"）"""
+        stats = self.stats(model_id)
+        if stats['last_throttled'] and time.time() - stats['last_throttled'] < THROTTLE_COOLDOWN_SECONDS:
+            return "throttled"
+        if stats['calls'] >= MIN_SAMPLES and (
+            stats['error_rate'] >= ERROR_RATE_THRESHOLD or stats['throttle_rate'] >= THROTTLE_RATE_THRESHOLD
+        ):
+            return "degraded"
+        return "healthy"
+
+    def expected_p95(self, model_id, prior_seconds):
+        """実測値が少ない間は事前の想定レイテンシを使った p95 の推定値"""
+        stats = self.stats(model_id)
+        if stats['p95'] is None or stats['calls'] < MIN_SAMPLES:
+            return prior_seconds
+        return stats['p95']
+
+    def rank_models(self, models, tier="balanced", sla_seconds=None):
+        """ティアまたは目標レイテンシに基づき、候補モデル名を優先順に並べる
+
+        Args:
+            models (dict): MODELS 形式のモデル設定（quality・expected_latency を参照）
+            tier (str): "fast" / "balanced" / "thorough"
+            sla_seconds (float): 目標レイテンシ（指定時はティアより優先）
+
+        Returns:
+            list: モデル名のリスト（先頭が第一候補、以降はフェイルオーバー先）
+        """
+        if sla_seconds is None:
+            sla_seconds = TIER_SLA_SECONDS.get(tier)
+
+        def sort_key(name):
+            info = models[name]
+            health = self.health(info['model_id'])
+            p95 = self.expected_p95(info['model_id'], info['expected_latency'])
+            if tier == "fast":
+                return (health != "healthy", p95)
+            # SLA を満たすモデルの中で最も高精度なもの、満たさなければ速い順
+            within_sla = sla_seconds is None or p95 <= sla_seconds
+            return (health != "healthy", not within_sla, -info['quality'] if within_sla else p95)
+
+        return sorted(models, key=sort_key)
@@ -0,0 +1,150 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pdf_extraction import spool_upload
+
+# OCR 設定（環境変数で変更可能）
+OCR_LANG = os.environ.get("RINGI_OCR_LANG", "jpn")
+OCR_DPI = int(os.environ.get("RINGI_OCR_DPI", 300))
+OCR_WORKERS = int(os.environ.get("RINGI_OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+OCR_CACHE_SIZE = int(os.environ.get("RINGI_OCR_CACHE_SIZE", 2000))
+
+
+def ocr_available(lang=OCR_LANG):
+    """OCR を利用できるか（pytesseract・Pillow・pypdfium2 と Tesseract 本体・言語モデル）
+
+    Returns:
+        tuple: (利用可否, 利用できない理由)
+    """
+    try:
+        import pypdfium2  # noqa: F401
+        import pytesseract
+        from PIL import Image  # noqa: F401
+    except ImportError as e:
+        return False, f"{e.name} がインストールされていません"
+    if not shutil.which("tesseract"):
+        return False, "Tesseract がインストールされていません"
+    try:
+        languages = pytesseract.get_languages(config="")
+    except Exception as e:
+        return False, f"Tesseract を実行できません: {e}"
+    if lang not in languages:
+        return False, f"Tesseract の言語モデル {lang} がインストールされていません"
+    return True, None
+
+
+def _ocr_image(mode, size, raw, lang):
+    """画像を OCR（ワーカープロセスで実行）"""
+    import pytesseract
+    from PIL import Image
+
+    image = Image.frombytes(mode, size, raw)
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+class OcrEngine:
+    """テキストのないページだけを画像化し、プロセスプールで OCR する
+
+    画像のハッシュごとに OCR 結果をキャッシュし、同じスキャン画像は再処理しない。
+    """
+
+    def __init__(self, max_workers=OCR_WORKERS, lang=OCR_LANG, dpi=OCR_DPI, cache_size=OCR_CACHE_SIZE):
+        self.lang = lang
+        self.dpi = dpi
+        self.cache_size = cache_size
+        self.max_in_flight = max_workers * 2
+        # Streamlit のサーバープロセスはスレッドを持つため、fork ではなく spawn でワーカーを起動する
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            text = self._cache.get(key)
+            if text is not None:
+                self._cache.move_to_end(key)
+            return text
+
+    def _store(self, key, text):
+        with self._lock:
+            self._cache[key] = text
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def ocr_pages(self, uploaded_file, page_numbers, stats=None):
+        """指定したページを OCR し、(ページ番号, テキスト) を完了順に返す（ジェネレーター）
+
+        ページの画像化は順に行い、画像化が済んだページから OCR をワーカープロセスに渡すため、
+        画像化と OCR が並行して進む。
+
+        Args:
+            uploaded_file: ファイルライクオブジェクト（Streamlit の UploadedFile など）
+            page_numbers (list): OCR するページ番号（1始まり）
+            stats (dict): 指定すると OCR の統計情報（ページ数・キャッシュ件数・ページ/秒）を格納
+        """
+        import pypdfium2
+
+        if stats is None:
+            stats = {}
+        start = time.perf_counter()
+        stats.update({'ocr_pages': 0, 'ocr_cached': 0, 'ocr_elapsed': 0.0, 'pages_per_second': 0.0})
+
+        def done(page_number, text):
+            stats['ocr_pages'] += 1
+            stats['ocr_elapsed'] = time.perf_counter() - start
+            stats['pages_per_second'] = stats['ocr_pages'] / stats['ocr_elapsed'] if stats['ocr_elapsed'] else 0.0
+            return page_number, text
+
+        def finish(future):
+            page_number, key = pending.pop(future)
+            text = future.result()
+            self._store(key, text)
+            return done(page_number, text)
+
+        uploaded_file.seek(0)
+        path = spool_upload(uploaded_file)
+        pending = {}
+        try:
+            try:
+                pdf = pypdfium2.PdfDocument(path)
+                try:
+                    for page_number in page_numbers:
+                        page = pdf[page_number - 1]
+                        try:
+                            image = page.render(scale=self.dpi / 72, grayscale=True).to_pil()
+                        finally:
+                            page.close()
+                        raw = image.tobytes()
+                        key = hashlib.sha256(raw).hexdigest()
+                        text = self._cached(key)
+                        if text is not None:
+                            stats['ocr_cached'] += 1
+                            yield done(page_number, text)
+                        else:
+                            # 画像を保持しすぎないよう、処理待ちのページ数を制限する
+                            while len(pending) >= self.max_in_flight:
+                                yield finish(next(as_completed(list(pending))))
+                            future = self._pool.submit(_ocr_image, image.mode, image.size, raw, self.lang)
+                            pending[future] = (page_number, key)
+                        # 画像化の合間に、完了したページを順次返す
+                        for future in [future for future in pending if future.done()]:
+                            yield finish(future)
+                finally:
+                    pdf.close()
+            finally:
+                os.unlink(path)
+
+            for future in as_completed(list(pending)):
+                yield finish(future)
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,340 @@
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+import unicodedata
+
+# 抽出上限（環境変数で変更可能）
+PDF_MAX_BYTES = int(os.environ.get("RINGI_PDF_MAX_BYTES", 200 * 1024 * 1024))
+PDF_MAX_PAGES = int(os.environ.get("RINGI_PDF_MAX_PAGES", 200))
+PDF_MAX_TEXT_CHARS = int(os.environ.get("RINGI_PDF_MAX_TEXT_CHARS", 300000))
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# 金額の単位
+_UNIT_MULTIPLIERS = {
+    "億": 100000000,
+    "千万": 10000000,
+    "百万": 1000000,
+    "万": 10000,
+    "千": 1000
+}
+_AMOUNT_RE = re.compile(
+    r'^[¥\\$]?\s*([-+△▲]?)\s*[¥\\$]?\s*(\d[\d,]*(?:\.\d+)?)\s*(億|千万|百万|万|千)?\s*(円)?$'
+)
+_HEADER_UNIT_RE = re.compile(r'(百万|千|万)円')
+# 集計対象とする金額の列（予算額・見積額・経費・価格など。数量・単価は合計しても意味がないため除外）
+_AMOUNT_HEADER_RE = re.compile(r'額|費|計|価格')
+_NON_AMOUNT_HEADER_RE = re.compile(r'単価|数量')
+_TOTAL_ROW_RE = re.compile(r'^(税込|税抜)?(合計|総計|総額|小計|計)(金額)?(\(.*\))?$')
+
+
+class PdfLimitError(Exception):
+    """PDF のサイズ上限を超えた場合の例外"""
+
+
+def current_rss_bytes():
+    """現在のプロセスの常駐メモリ（RSS）をバイト単位で取得"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # /proc がない環境ではプロセス開始以降の最大値で代用
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssMonitor:
+    """抽出中の RSS のピークを記録"""
+
+    def __init__(self):
+        self.baseline = current_rss_bytes()
+        self.peak = self.baseline
+
+    def sample(self):
+        self.peak = max(self.peak, current_rss_bytes())
+        return self.peak
+
+
+def spool_upload(uploaded_file, max_bytes=PDF_MAX_BYTES):
+    """アップロードファイルを一時ファイルへ書き出し、そのパスを返す"""
+    uploaded_file.seek(0)
+    spool = tempfile.NamedTemporaryFile(prefix="ringi_", suffix=".pdf", delete=False)
+    written = 0
+    try:
+        with spool:
+            while True:
+                chunk = uploaded_file.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise PdfLimitError(
+                        f"ファイルサイズが上限（{max_bytes // (1024 * 1024)}MB）を超えています"
+                    )
+                spool.write(chunk)
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name
+
+
+def _release_page(page):
+    """pdfplumber のページが保持するレイアウトオブジェクトを解放"""
+    close = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+    if close:
+        close()
+
+
+def parse_amount(value):
+    """表のセルを数値として解釈（「1,200,000円」「500万円」「△30」など）
+
+    Returns:
+        tuple: (数値, 円表記かどうか)。数値でない場合は None
+    """
+    if not value:
+        return None
+    text = unicodedata.normalize("NFKC", str(value)).replace(" ", "").replace("\n", "")
+    match = _AMOUNT_RE.match(text)
+    if not match:
+        return None
+    sign, number, unit, yen = match.groups()
+    amount = float(number.replace(",", "")) * _UNIT_MULTIPLIERS.get(unit, 1)
+    if sign in ("-", "△", "▲"):
+        amount = -amount
+    return amount, bool(unit or yen or text[0] in "¥\\")
+
+
+def _format_amount(amount, is_yen):
+    text = f"{amount:,.0f}" if amount == int(amount) else f"{amount:,.2f}"
+    return f"{text}円" if is_yen else text
+
+
+def _clean_cell(cell):
+    return re.sub(r'\s+', ' ', cell or "").strip()
+
+
+def summarize_table(rows):
+    """表の金額列を合計し、表記されている合計行と照合
+
+    Returns:
+        list: 列ごとの集計結果の説明文
+    """
+    if len(rows) < 2:
+        return []
+    header, body = rows[0], rows[1:]
+    labels = [unicodedata.normalize("NFKC", next((c for c in row if c), "")).replace(" ", "") for row in body]
+    detail_rows = [row for row, label in zip(body, labels) if not _TOTAL_ROW_RE.match(label)]
+    total_rows = [
+        row for row, label in zip(body, labels)
+        if _TOTAL_ROW_RE.match(label) and "小計" not in label
+    ]
+
+    summaries = []
+    for col in range(len(header)):
+        header_text = unicodedata.normalize("NFKC", header[col] or "")
+        if not _AMOUNT_HEADER_RE.search(header_text) or _NON_AMOUNT_HEADER_RE.search(header_text):
+            continue
+        parsed = [parse_amount(row[col]) for row in detail_rows if col < len(row) and row[col]]
+        numbers = [p for p in parsed if p is not None]
+        if len(numbers) < 2 or len(numbers) < len(parsed) / 2:
+            continue
+
+        # 見出しに単位（千円・万円など）があれば、単位のないセルだけ円に換算
+        unit_match = _HEADER_UNIT_RE.search(header_text)
+        multiplier = _UNIT_MULTIPLIERS[unit_match.group(1)] if unit_match else 1
+
+        def to_yen(parsed_amount):
+            amount, has_unit = parsed_amount
+            return amount if has_unit else amount * multiplier
+
+        is_yen = bool(unit_match) or any(is_yen for _, is_yen in numbers)
+        total = sum(to_yen(p) for p in numbers)
+
+        label = header[col] or f"{col + 1}列目"
+        summary = f"〔自動集計〕{label}: 明細合計 {_format_amount(total, is_yen)}"
+        stated = [parse_amount(row[col]) for row in total_rows if col < len(row)]
+        stated = [to_yen(p) for p in stated if p is not None]
+        if stated:
+            difference = stated[-1] - total
+            if abs(difference) < 0.5:
+                summary += f"（表記の合計 {_format_amount(stated[-1], is_yen)} と一致）"
+            else:
+                summary += (
+                    f"（⚠ 表記の合計 {_format_amount(stated[-1], is_yen)} と不一致、"
+                    f"差額 {_format_amount(difference, is_yen)}）"
+                )
+        summaries.append(summary)
+    return summaries
+
+
+def format_table(rows):
+    """pdfplumber の表をコンパクトな Markdown 表と集計結果に変換"""
+    rows = [[_clean_cell(cell) for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+
+    # 全行が空の列は削除
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    keep = [col for col in range(width) if any(row[col] for row in rows)]
+    rows = [[row[col] for col in keep] for row in rows]
+
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * len(keep)]
+    lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    lines += summarize_table(rows)
+    return "\n".join(lines)
+
+
+def _outside_tables(bboxes):
+    def test(obj):
+        x = (obj.get("x0", 0) + obj.get("x1", 0)) / 2
+        y = (obj.get("top", 0) + obj.get("bottom", 0)) / 2
+        return not any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+    return test
+
+
+def _extract_page_with_tables(page, stats):
+    """表を Markdown に整形し、表以外のテキストと位置順に並べて抽出"""
+    tables = page.find_tables()
+    if not tables:
+        return page.extract_text() or ""
+
+    x0, page_top, x1, page_bottom = page.bbox
+    bboxes = [table.bbox for table in tables]
+    outside = _outside_tables(bboxes)
+
+    def region_text(top, bottom):
+        top, bottom = max(top, page_top), min(bottom, page_bottom)
+        if bottom - top < 1:
+            return ""
+        return page.crop((x0, top, x1, bottom)).filter(outside).extract_text() or ""
+
+    parts = []
+    cursor = page_top
+    for table in sorted(tables, key=lambda t: t.bbox[1]):
+        _, table_top, _, table_bottom = table.bbox
+        if table_top > cursor:
+            parts.append(region_text(cursor, table_top))
+        parts.append(format_table(table.extract()))
+        # 表の横に配置されたテキスト
+        parts.append(region_text(max(cursor, table_top), table_bottom))
+        cursor = max(cursor, table_bottom)
+    parts.append(region_text(cursor, page_bottom))
+
+    stats['tables'] = stats.get('tables', 0) + len(tables)
+    return "\n".join(part for part in parts if part.strip())
+
+
+def load_pdf_libraries(stats=None):
+    """PDF ライブラリ（PyPDF2・pdfplumber）を読み込み
+
+    pdfplumber は pdfminer を含めて読み込みに時間がかかるため、起動時ではなく
+    最初の PDF 抽出時に読み込む。stats を指定すると、初回の読み込み時のみ
+    読み込み時間（library_import_seconds）を格納する。
+    """
+    first_time = "pdfplumber" not in sys.modules
+    start = time.perf_counter()
+    import PyPDF2
+    import pdfplumber
+    if first_time and stats is not None:
+        stats['library_import_seconds'] = time.perf_counter() - start
+    return PyPDF2, pdfplumber
+
+
+def _extract_with_pdfplumber(stream, max_pages, max_chars, monitor, stats, tables=True):
+    _, pdfplumber = load_pdf_libraries()
+    pages = []
+    total_chars = 0
+    with pdfplumber.open(stream) as pdf:
+        stats['pages_total'] = len(pdf.pages)
+        for page_number, page in enumerate(pdf.pages, start=1):
+            if page_number > max_pages:
+                stats['truncated'] = f"ページ数上限（{max_pages}ページ）"
+                break
+            try:
+                if tables:
+                    page_text = _extract_page_with_tables(page, stats)
+                else:
+                    page_text = page.extract_text() or ""
+            finally:
+                _release_page(page)
+            pages.append(page_text)
+            total_chars += len(page_text)
+            monitor.sample()
+            if total_chars > max_chars:
+                stats['truncated'] = f"文字数上限（{max_chars:,}文字）"
+                break
+    return pages
+
+
+def _extract_with_pypdf2(stream, max_pages, max_chars, monitor, stats):
+    PyPDF2, _ = load_pdf_libraries()
+    pages = []
+    total_chars = 0
+    pdf_reader = PyPDF2.PdfReader(stream)
+    stats['pages_total'] = len(pdf_reader.pages)
+    for page_number, page in enumerate(pdf_reader.pages, start=1):
+        if page_number > max_pages:
+            stats['truncated'] = f"ページ数上限（{max_pages}ページ）"
+            break
+        page_text = page.extract_text() or ""
+        pages.append(page_text)
+        total_chars += len(page_text)
+        monitor.sample()
+        if total_chars > max_chars:
+            stats['truncated'] = f"文字数上限（{max_chars:,}文字）"
+            break
+    return pages
+
+
+def extract_pages(uploaded_file, stats=None, tables=True, max_pages=PDF_MAX_PAGES,
+                  max_bytes=PDF_MAX_BYTES, max_chars=PDF_MAX_TEXT_CHARS):
+    """メモリ使用量を抑えて PDF からページごとのテキストを抽出
+
+    アップロードファイルを一時ファイルに書き出してメモリマップし、
+    ページごとにレイアウトオブジェクトを解放しながら抽出する。
+    ページ数・文字数の上限に達した時点で抽出を打ち切る。
+
+    Args:
+        uploaded_file: ファイルライクオブジェクト（Streamlit の UploadedFile など）
+        stats (dict): 指定すると抽出の統計情報（ページ数・ピーク RSS など）を格納
+        tables (bool): 表を検出して Markdown 表と数値列の集計に変換するか
+
+    Returns:
+        list: ページごとのテキスト
+    """
+    if stats is None:
+        stats = {}
+    load_pdf_libraries(stats)
+    start = time.perf_counter()
+    monitor = RssMonitor()
+    stats.update({'pages_total': 0, 'truncated': None, 'engine': None, 'tables': 0})
+
+    path = spool_upload(uploaded_file, max_bytes)
+    try:
+        stats['file_bytes'] = os.path.getsize(path)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # pdfplumber で抽出（より高精度）
+            stats['engine'] = "pdfplumber"
+            pages = _extract_with_pdfplumber(mapped, max_pages, max_chars, monitor, stats, tables)
+
+            # pdfplumber で抽出できない場合は PyPDF2 を試行
+            if not any(page.strip() for page in pages):
+                mapped.seek(0)
+                stats['engine'] = "PyPDF2"
+                stats['truncated'] = None
+                pages = _extract_with_pypdf2(mapped, max_pages, max_chars, monitor, stats)
+    finally:
+        os.unlink(path)
+
+    stats['pages_read'] = len(pages)
+    # テキスト層のないページ（スキャン画像など）
+    stats['empty_pages'] = [i for i, page in enumerate(pages, start=1) if not page.strip()]
+    stats['peak_rss_bytes'] = monitor.sample()
+    stats['rss_increase_bytes'] = monitor.peak - monitor.baseline
+    stats['elapsed'] = time.perf_counter() - start
+    return pages
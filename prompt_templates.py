@@ -0,0 +1,184 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 保持するテンプレート数の上限（チェック項目の設定と詳細度ごとに1つ）
+MAX_TEMPLATES = 32
+
+AGGREGATION_NOTE = (
+    "※「〔自動集計〕」は稟議書内の表の数値をシステムで合計した結果です。"
+    "予算・コストの評価では、この集計値と表記の合計の一致・不一致を根拠として用いてください。\n"
+)
+
+EVIDENCE_NOTE = (
+    "※ 稟議書全文から、チェック観点ごとに関連するセクションのみを抜粋しています。"
+    "該当部分の抜粋には [セクション番号] とページ（p.N）を明記してください。\n"
+)
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+def check_items_fingerprint(check_items):
+    """チェック項目の設定（カテゴリ・項目・並び順）のフィンガープリント"""
+    source = repr([(category, list(items)) for category, items in check_items.items()])
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def point_table(categories):
+    """カテゴリごとの配点（100点を均等に配分し、余りは最後のカテゴリに加算）"""
+    categories = list(categories)
+    if not categories:
+        return []
+    points_per_category = 100 // len(categories)
+    remaining_points = 100 % len(categories)
+    return [
+        (category, points_per_category + (remaining_points if i == len(categories) - 1 else 0))
+        for i, category in enumerate(categories)
+    ]
+
+
+def create_reference_text(reference):
+    """類似稟議書の過去チェック結果と差分をプロンプト用に整形"""
+    return f"""
+【参考: 類似稟議書の過去チェック結果（類似度 {reference['similarity']:.0%}）】
+{reference['result']}
+
+【前回の稟議書からの差分】
+```diff
+{reference['diff']}
+```
+差分箇所を重点的に再評価し、変更のない部分は過去の評価と整合させてください。
+"""
+
+
+# レポートの詳細度ごとのチェック項目別評価の書式
+DETAIL_FORMATS = {
+    "full": """### {category} (X/{points}点)
+**該当部分の抜粋**:
+```
+[稟議書から該当する部分を抜粋]
+```
+
+**評価根拠**:
+- [なぜこの点数なのかの理由]
+
+**推奨修正案**:
+- [具体的な修正提案]
+
+""",
+    "standard": """### {category} (X/{points}点)
+**該当部分**: [稟議書から該当する部分を1〜2行で抜粋]
+**評価根拠**: [なぜこの点数なのかを簡潔に]
+**推奨修正案**: [最も効果の大きい修正提案]
+
+""",
+    "brief": "### {category} (X/{points}点) - [評価の根拠を1文で]\n",
+}
+
+
+class CheckPromptTemplate:
+    """チェック項目の設定とレポートの詳細度ごとに組み立て済みのチェック用プロンプト
+
+    指示・チェック観点・出力形式・配点からなる固定部分（prefix）を事前に作成し、
+    稟議書の内容は末尾に付け加える。prefix は同じ設定のチェック間で完全に一致するため、
+    プロンプトキャッシュでも再利用しやすい。
+    """
+
+    def __init__(self, check_items, profile="full"):
+        self.fingerprint = check_items_fingerprint(check_items)
+        self.profile = profile
+        self.categories = list(check_items.keys())
+        self.points = point_table(self.categories)
+
+        check_items_text = "".join(
+            f"\n{category}:\n" + "".join(f"- {item}\n" for item in items)
+            for category, items in check_items.items()
+        )
+        ratings_text = "".join(
+            f"- **{category}**: ⭐⭐⭐⭐⭐ (X/5) - [簡潔な評価コメント]\n"
+            for category in self.categories
+        )
+        details_text = "".join(
+            DETAIL_FORMATS[profile].format(category=category, points=category_points)
+            for category, category_points in self.points
+        )
+
+        if profile == "brief":
+            body = f"""## 📋 チェック項目別評価
+{details_text}
+## 🚨 重要な指摘事項
+- [承認に影響する重要な問題点（最大3点）]
+"""
+            closing = "各項目は1文で簡潔に記述してください。"
+        else:
+            limit = "（主要なものを3点以内で）" if profile == "standard" else ""
+            body = f"""## ✅ 良い点
+- [具体的な良い点を列挙{limit}]
+
+## ⚠️ 改善が必要な点
+- [具体的な問題点を列挙{limit}]
+
+## 💡 具体的な改善提案
+- [実行可能な改善案を提示{limit}]
+
+## 📋 チェック項目別詳細評価
+
+{details_text}## 🚨 重要な指摘事項
+- [承認に影響する重要な問題点]
+"""
+            closing = "各項目は簡潔に記述してください。" if profile == "standard" else ""
+            if profile == "full":
+                body += """
+## 📝 修正版サンプル（重要部分のみ）
+```
+[最も重要な修正箇所について、修正後のサンプルテキストを提示]
+```
+"""
+
+        self.prefix = f"""
+末尾の【稟議書内容】の稟議書を詳細にチェックし、改善提案を行ってください。
+
+【チェック観点】
+{check_items_text}
+【出力形式】
+## 📊 総合評価・最終判定
+- **評価点数**: X/100点
+- **承認可否**: ○（承認可）/ △（条件付き承認）/ ×（承認不可）
+- **判定理由**: [承認可否の根拠]
+- **総合コメント**: [全体的な評価と印象]
+
+### 📈 カテゴリ別評価（5段階）
+{ratings_text}
+{body}
+必ず最初の総合評価で承認可否と各カテゴリの5段階評価（⭐で表現）を含めてください。{closing}
+"""
+
+    def render(self, ringi_text, reference=None, evidence=None):
+        """稟議書の内容（と類似稟議書の参考情報）を末尾に加えてプロンプトを作成
+
+        evidence（evidence_index.format_evidence の出力）を指定すると、全文の代わりに
+        チェック観点ごとの関連箇所の抜粋を渡す。
+        """
+        reference_text = create_reference_text(reference) if reference else ""
+        # 表の数値列を事前集計している場合の注記
+        note = AGGREGATION_NOTE if "〔自動集計〕" in ringi_text else ""
+        if evidence:
+            return f"{self.prefix}{reference_text}\n{note}{EVIDENCE_NOTE}【稟議書内容（関連箇所の抜粋）】\n{evidence}"
+        return f"{self.prefix}{reference_text}\n{note}【稟議書内容】\n{ringi_text}\n"
+
+
+def get_check_template(check_items, profile="full"):
+    """チェック項目の設定とレポートの詳細度に対応するテンプレートを取得（フィンガープリントごとにキャッシュ）"""
+    key = (check_items_fingerprint(check_items), profile)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+    template = CheckPromptTemplate(check_items, profile)
+    with _templates_lock:
+        _templates[key] = template
+        while len(_templates) > MAX_TEMPLATES:
+            _templates.popitem(last=False)
+    return template
@@ -1,12 +1,30 @@
+import time
+_import_start = time.perf_counter()
 import streamlit as st
-import boto3
 import json
 from datetime import datetime
 import re
-import PyPDF2
-import pdfplumber
+import threading
 import io
+import batch_pipeline
+import call_control
+import check_item_store
+import consistency
+import copy
+import evidence_index
+import model_provider
+import model_selector
+import ocr_extraction
 import os
+import pdf_extraction
+import prompt_templates
+import ringi_similarity
+import startup
+import text_compaction
+import token_budget
+from stream_parser import ReportStreamParser
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+IMPORT_SECONDS = time.perf_counter() - _import_start
 
 # ページ設定
 st.set_page_config(
@@ -21,25 +39,46 @@ MODELS = {
         "model_id": "anthropic.claude-3-5-sonnet-20240620-v1:0",
         "description": "最高性能 - 詳細な分析に最適",
         "max_tokens": 8000,
+        "context_window": 200000,
         "icon": "🧠",
-        "provider": "Anthropic"
+        "provider": "Anthropic",
+        "consistency_samples": 3,
+        "quality": 3,
+        "expected_latency": 40
     },
     "Nova Pro": {
         "model_id": "amazon.nova-pro-v1:0",
         "description": "Amazon最高性能 - 総合的な分析",
         "max_tokens": 5000,
+        "context_window": 300000,
         "icon": "🚀",
-        "provider": "Amazon"
+        "provider": "Amazon",
+        "consistency_samples": 3,
+        "quality": 2,
+        "expected_latency": 25
     },
     "Claude 3 Haiku": {
         "model_id": "anthropic.claude-3-haiku-20240307-v1:0", 
         "description": "高速チェック - 基本的な確認",
         "max_tokens": 4000,
+        "context_window": 200000,
         "icon": "⚡",
-        "provider": "Anthropic"
+        "provider": "Anthropic",
+        "consistency_samples": 5,
+        "quality": 1,
+        "expected_latency": 10
     }
 }
 
+# ローカルバックエンド（LOCAL_LLM_BASE_URL 設定時のみ）
+if model_provider.local_model_config():
+    MODELS["Local LLM"] = {
+        **model_provider.local_model_config(),
+        "consistency_samples": 5,
+        "quality": 0,
+        "expected_latency": 60
+    }
+
 # 稟議書チェック項目（デフォルト）
 DEFAULT_CHECK_ITEMS = {
     "基本情報": [
@@ -74,64 +113,112 @@ DEFAULT_CHECK_ITEMS = {
     ]
 }
 
-def initialize_check_items():
-    """チェック項目を初期化"""
-    if 'check_items' not in st.session_state:
-        st.session_state.check_items = DEFAULT_CHECK_ITEMS.copy()
-    return st.session_state.check_items
+# 従来のチェック項目保存ファイル（共通プロファイルの初版として取り込む）
+LEGACY_CHECK_ITEMS_FILE = "custom_check_items.json"
+
+# 類似稟議書の再利用設定（デフォルト）
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+DEFAULT_REUSE_THRESHOLD = 0.95
 
-def save_check_items_to_file(check_items, filename="custom_check_items.json"):
-    """チェック項目をファイルに保存"""
+@st.cache_resource
+def get_profile_store():
+    """全セッションで共有するチェック項目プロファイルのストアを取得"""
+    store = check_item_store.CheckItemProfileStore(default_items=DEFAULT_CHECK_ITEMS)
+    # 従来の custom_check_items.json があれば共通プロファイルの初版として取り込む
+    if check_item_store.DEFAULT_PROFILE not in store.list_profiles() and os.path.exists(LEGACY_CHECK_ITEMS_FILE):
+        try:
+            with open(LEGACY_CHECK_ITEMS_FILE, 'r', encoding='utf-8') as f:
+                store.save(check_item_store.DEFAULT_PROFILE, json.load(f), base_version=0)
+        except Exception as e:
+            st.error(f"読み込みエラー: {e}")
+    return store
+
+def load_check_items_profile(profile_name):
+    """プロファイルを取得（ファイルが壊れている場合はエラーを表示し、デフォルトのチェック項目の版 0 を返す）"""
+    store = get_profile_store()
     try:
-        import json
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(check_items, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        st.error(f"保存エラー: {e}")
-        return False
+        return store.get(profile_name)
+    except check_item_store.ProfileLoadError as e:
+        st.error(f"読み込みエラー: {e}。デフォルトのチェック項目を使用します（保存すると置き換えます）")
+        return store.default_profile(profile_name)
 
-def load_check_items_from_file(filename="custom_check_items.json"):
-    """ファイルからチェック項目を読み込み"""
+def initialize_check_items(profile_name, profile):
+    """チェック項目を初期化
+
+    編集中の下書きがあればそれを、なければ全セッションで共有するプロファイル（profile）のチェック項目を返す。
+    共有のチェック項目は変更しないこと（編集は start_check_items_draft で作成した下書きに対して行う）。
+    """
+    if st.session_state.get('check_items_profile') != profile_name:
+        discard_check_items_draft()
+        st.session_state.check_items_profile = profile_name
+    if 'check_items' in st.session_state:
+        return st.session_state.check_items
+    return profile['check_items']
+
+def start_check_items_draft(profile, check_items=None):
+    """プロファイル（load_check_items_profile の結果）の編集用にセッション専用の下書きを作成"""
+    st.session_state.check_items = copy.deepcopy(check_items if check_items is not None else profile['check_items'])
+    st.session_state.check_items_base_version = profile['version']
+    return st.session_state.check_items
+
+def discard_check_items_draft():
+    """編集中の下書きを破棄し、共有プロファイルに戻す"""
+    st.session_state.pop('check_items', None)
+    st.session_state.pop('check_items_base_version', None)
+
+def save_check_items_profile(profile_name, check_items, base_version=None):
+    """チェック項目をプロファイルの新しい版として保存"""
     try:
-        import json
-        with open(filename, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
+        profile = get_profile_store().save(profile_name, check_items, base_version)
+        discard_check_items_draft()
+        return profile
+    except check_item_store.ProfileConflictError as e:
+        st.error(f"保存エラー: {e}。最新の版を読み込んでから編集し直してください")
         return None
     except Exception as e:
-        st.error(f"読み込みエラー: {e}")
+        st.error(f"保存エラー: {e}")
         return None
 
-def extract_text_from_pdf(pdf_file):
-    """PDFファイルからテキストを抽出"""
+def extract_pages_from_pdf(pdf_file, stats=None, tables=True):
+    """PDFファイルからページごとのテキストを抽出（メモリ使用量を抑えたページ単位の抽出）"""
     try:
-        # pdfplumberを使用してテキスト抽出（より高精度）
-        with pdfplumber.open(pdf_file) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        
-        if text.strip():
-            return text.strip()
-        
-        # pdfplumberで抽出できない場合はPyPDF2を試行
-        pdf_file.seek(0)  # ファイルポインタをリセット
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        
-        return text.strip() if text.strip() else None
+        # テキストのないページも OCR で補えるよう、ページ数分のリストを返す
+        return pdf_extraction.extract_pages(pdf_file, stats, tables)
         
     except Exception as e:
         st.error(f"PDF読み込みエラー: {e}")
         return None
 
+@st.cache_resource
+def get_ocr_engine():
+    """全セッションで共有する OCR エンジン（ワーカープロセスと画像ハッシュごとの結果キャッシュ）を取得"""
+    return ocr_extraction.OcrEngine()
+
+@st.cache_resource
+def check_ocr_available():
+    """OCR を利用できるか（起動後に Tesseract の状態を一度だけ確認）"""
+    return ocr_extraction.ocr_available()
+
+def ocr_empty_pages(pdf_file, pages, page_numbers, progress=None):
+    """テキストのないページを OCR で補い、OCR の統計情報を返す
+
+    progress（st.progress）を指定すると、ページごとに進捗と処理速度を表示する。
+    """
+    stats = {}
+    try:
+        for done, (page_number, text) in enumerate(
+            get_ocr_engine().ocr_pages(pdf_file, page_numbers, stats), start=1
+        ):
+            pages[page_number - 1] = text
+            if progress is not None:
+                progress.progress(
+                    done / len(page_numbers),
+                    text=f"🔎 OCR {done}/{len(page_numbers)}ページ（{stats['pages_per_second']:.1f}ページ/秒）"
+                )
+    except Exception as e:
+        st.error(f"OCRエラー: {e}")
+    return stats
+
 def clean_extracted_text(text):
     """抽出されたテキストをクリーンアップ"""
     if not text:
@@ -144,185 +231,600 @@ def clean_extracted_text(text):
     
     return text
 
-def initialize_bedrock_client():
-    """Bedrock Runtime クライアントを初期化"""
-    try:
-        return boto3.client(
-            service_name='bedrock-runtime',
-            region_name='us-east-1'
-        )
-    except Exception as e:
-        st.error(f"AWS 接続エラー: {e}")
-        return None
-    """Bedrock Runtime クライアントを初期化"""
+@st.cache_resource
+def get_similarity_index():
+    """全セッションで共有する類似稟議書インデックスを取得"""
+    return ringi_similarity.SimilarityIndex()
+
+def similarity_context_key(model_name, check_items, report_profile, evidence_top_k):
+    """過去結果を再利用できる条件のキー（モデル・チェック項目・レポートの詳細度・関連箇所の抜粋・出力上限）
+
+    evidence_top_k は関連箇所の抜粋を使わない場合は None。
+    """
+    info = MODELS[model_name]
+    return ringi_similarity.context_key(info['model_id'], check_items, {
+        'report_profile': report_profile,
+        'evidence_top_k': evidence_top_k,
+        'max_tokens': token_budget.output_budget(len(check_items), report_profile, info['max_tokens'])
+    })
+
+def find_similar_check(ringi_text, key, threshold):
+    """類似した過去のチェック結果を検索（key は similarity_context_key の結果）
+
+    シグネチャの計算時間と検索時間を表示する。
+
+    Returns:
+        tuple: (過去のチェック内容 or None, 類似度, シグネチャ, コンテキストキー)
+    """
+    start = time.perf_counter()
+    signature = ringi_similarity.minhash_signature(ringi_text)
+    hashed = time.perf_counter()
+    similar, similarity = None, 0.0
     try:
-        return boto3.client(
-            service_name='bedrock-runtime',
-            region_name='us-east-1'
+        match = get_similarity_index().query(signature, key, threshold)
+        queried = time.perf_counter()
+        st.caption(
+            f"♻️ 類似検索: シグネチャ計算 {(hashed - start) * 1000:.1f}ms / "
+            f"検索 {(queried - hashed) * 1000:.2f}ms"
         )
+        if match:
+            similar, similarity = get_similarity_index().get(match[0]), match[1]
     except Exception as e:
-        st.error(f"AWS 接続エラー: {e}")
-        return None
+        st.warning(f"類似稟議書の検索に失敗しました: {e}")
+    return similar, similarity, signature, key
 
-def call_claude(client, model_id, prompt, max_tokens=4000, temperature=0.3):
-    """Claude を呼び出す"""
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    }
-    
+@st.cache_resource
+def get_startup_report():
+    """プロセスの起動フェーズごとの所要時間の記録を取得"""
+    report = startup.StartupReport()
+    report.record("アプリモジュールの読み込み", IMPORT_SECONDS)
+    return report
+
+@st.cache_resource
+def get_bedrock_warmer():
+    """全セッションで共有する Bedrock クライアントの作成・事前接続をバックグラウンドで開始"""
+    return startup.BedrockWarmer(
+        get_startup_report(),
+        region_name='us-east-1',
+        max_pool_connections=call_control.MAX_CONCURRENT_CALLS,
+        # 事前接続には最も安価なモデルへの出力1トークンの呼び出しを使う
+        warmup_model_id=MODELS["Claude 3 Haiku"]['model_id']
+    ).start()
+
+def initialize_bedrock_client():
+    """Bedrock Runtime クライアントを取得（作成中の場合は完了を待つ）"""
+    warmer = get_bedrock_warmer()
+    client = warmer.wait()
+    if client is None:
+        st.error(f"AWS 接続エラー: {warmer.error}")
+    return client
+
+def call_model_stream(client, model_id, provider, prompt, max_tokens=4000, temperature=0.3, status=None,
+                      on_open=None):
+    """プロバイダーに応じてモデルをストリーミングで呼び出す（Bedrock は ConverseStream API）
+
+    呼び出し側がジェネレーターを close すると、その時点でストリームを閉じて生成を打ち切る。
+    status を指定した場合、usage・stop_reason を格納し、エラーは表示せずに
+    status['error'] に格納する（呼び出し側で処理）。
+    on_open には開いたレスポンスが渡される（CancellableCall.attach で中止時に閉じる）。
+    """
+    call_status = status if status is not None else {}
     try:
-        response = client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body),
-            contentType='application/json'
-        )
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
+        backend = model_provider.get_provider(provider, client)
+        yield from backend.stream(model_id, prompt, max_tokens, temperature, call_status, on_open)
     except Exception as e:
-        st.error(f"Claude 呼び出しエラー: {e}")
-        return None
+        if status is None:
+            st.error(f"{provider} 呼び出しエラー: {e}")
+        else:
+            status['error'] = e
 
-def call_nova(client, model_id, prompt, max_tokens=4000, temperature=0.3):
-    """Amazon Nova を呼び出す"""
-    body = {
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": prompt
-                    }
-                ]
-            }
-        ],
-        "inferenceConfig": {
-            "max_new_tokens": max_tokens,
-            "temperature": temperature
-        }
-    }
-    
-    try:
-        response = client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body),
-            contentType='application/json'
+@st.cache_resource
+def get_model_selector():
+    """全セッションで共有するモデル実測統計を取得"""
+    return model_selector.ModelSelector()
+
+@st.cache_resource
+def get_token_estimator():
+    """全セッションで共有するトークン数推定（実測の入力トークン数でモデルごとに補正）"""
+    return token_budget.TokenEstimator()
+
+def stream_with_failover(client, candidates, prompt, status, max_tokens=None, call=None, label=None):
+    """候補モデルを順に呼び出し、応答開始前にスロットリング・エラーが発生した場合は次のモデルに切り替える
+
+    各呼び出しのレイテンシと結果はモデル実測統計に記録し、入力トークン数の実測値で
+    トークン数推定を補正する。max_tokens は各モデルの上限を超えない範囲で適用する。
+    call（call_control.CancellableCall）を指定すると、開いたレスポンスを中止時に閉じられるよう登録し、
+    中止後は次のモデルに切り替えない。label を指定すると切り替え・エラーの表示に付ける（一括チェックのファイル名）。
+    status['model'] には実際に応答したモデル名が入り、エラーで終わった場合は status['error'] に最後のエラーが入る。
+    """
+    prefix = f"{label}: " if label else ""
+    selector = get_model_selector()
+    estimator = get_token_estimator()
+    for i, name in enumerate(candidates):
+        info = MODELS[name]
+        call_status = {}
+        text = ""
+        first_token_latency = None
+        completed = False
+        start = time.monotonic()
+        stream = call_model_stream(
+            client, info['model_id'], info['provider'], prompt,
+            min(max_tokens, info['max_tokens']) if max_tokens else info['max_tokens'], 0.3, call_status,
+            call.attach if call is not None else None
         )
-        response_body = json.loads(response['body'].read())
-        return response_body['output']['message']['content'][0]['text']
-    except Exception as e:
-        st.error(f"Nova 呼び出しエラー: {e}")
-        return None
+        status['model'] = name
+        try:
+            for chunk in stream:
+                if first_token_latency is None:
+                    first_token_latency = time.monotonic() - start
+                text += chunk
+                yield chunk
+            completed = True
+        finally:
+            stream.close()
+            error = call_status.get('error')
+            cancelled = call is not None and call.cancelled
+            # 途中で打ち切った・中止した呼び出しはレイテンシを記録しない
+            if error is not None and not cancelled:
+                outcome = "throttled" if model_selector.is_throttling_error(error) else "error"
+                selector.record(info['model_id'], time.monotonic() - start, outcome)
+            elif completed:
+                output_tokens = call_status.get('usage', {}).get('outputTokens')
+                estimator.calibrate(info['model_id'], prompt, call_status.get('usage', {}).get('inputTokens'))
+                selector.record(
+                    info['model_id'], time.monotonic() - start, "ok",
+                    first_token_latency, output_tokens or token_budget.estimate_tokens(text)
+                )
+        
+        if cancelled:
+            return
+        if error is None:
+            status['usage'] = call_status.get('usage', {})
+            status['stop_reason'] = call_status.get('stop_reason')
+            return
+        if text or i == len(candidates) - 1:
+            status['error'] = error
+            st.error(f"{prefix}{name} 呼び出しエラー: {error}")
+            return
+        reason = "スロットリング中" if model_selector.is_throttling_error(error) else "エラーを返した"
+        st.warning(f"⚠️ {prefix}{name} が{reason}ため、{candidates[i + 1]} に切り替えます")
 
-def call_model(client, model_id, provider, prompt, max_tokens=4000, temperature=0.3):
-    """プロバイダーに応じてモデルを呼び出す"""
-    if provider == "Anthropic":
-        return call_claude(client, model_id, prompt, max_tokens, temperature)
-    elif provider == "Amazon":
-        return call_nova(client, model_id, prompt, max_tokens, temperature)
-    else:
-        st.error(f"サポートされていないプロバイダー: {provider}")
-        return None
+@st.cache_resource
+def get_call_slots():
+    """全セッションで共有するモデル呼び出しの同時実行枠を取得"""
+    return call_control.CallSlots()
 
-def create_check_prompt(ringi_text, check_items):
-    """稟議書チェック用のプロンプトを作成（詳細チェックのみ）"""
-    
-    # チェック項目をプロンプト用に整形
-    check_items_text = ""
-    for category, items in check_items.items():
-        check_items_text += f"\n{category}:\n"
-        for item in items:
-            check_items_text += f"- {item}\n"
-    
-    prompt = f"""
-以下の稟議書を詳細にチェックし、改善提案を行ってください。
+@st.cache_resource
+def get_cancellation_stats():
+    """全セッションで共有する呼び出し中止の集計を取得"""
+    return call_control.CancellationStats()
 
-【稟議書内容】
-{ringi_text}
+def cancel_active_call():
+    """このセッションで実行中のモデル呼び出し（一貫性チェックの各サンプルを含む）を中止"""
+    for call in st.session_state.pop('active_calls', []):
+        call.cancel()
 
-【チェック観点】
-{check_items_text}
+def record_cancellation(call, model_name, notify=True):
+    """中止した呼び出しの生成済み・回避できたトークン数を記録"""
+    info = MODELS[model_name]
+    generated = token_budget.estimate_tokens(call.text)
+    # 想定出力はモデルの実測平均（未計測なら出力上限）
+    expected = get_model_selector().stats(info['model_id'])['avg_output_tokens'] or info['max_tokens']
+    avoided = max(0, int(expected - generated))
+    get_cancellation_stats().record(generated, avoided)
+    if notify:
+        st.session_state.last_cancelled = {
+            'model': model_name,
+            'elapsed': time.monotonic() - call.started_at,
+            'generated_tokens': generated,
+            'avoided_tokens': avoided
+        }
 
-【出力形式】
-## 📊 総合評価・最終判定
-- **評価点数**: X/100点
-- **承認可否**: ○（承認可）/ △（条件付き承認）/ ×（承認不可）
-- **判定理由**: [承認可否の根拠]
-- **総合コメント**: [全体的な評価と印象]
+def render_model_stats(selector):
+    """モデルごとの実測パフォーマンスを表示"""
+    health_labels = {"healthy": "🟢 正常", "degraded": "🟡 劣化", "throttled": "🔴 制限中"}
+    rows = []
+    for name, info in MODELS.items():
+        stats = selector.stats(info['model_id'])
+        rows.append({
+            "モデル": f"{info['icon']} {name}",
+            "状態": health_labels[selector.health(info['model_id'])],
+            "呼出数": stats['calls'],
+            "p50(秒)": round(stats['p50'], 1) if stats['p50'] is not None else None,
+            "p95(秒)": round(stats['p95'], 1) if stats['p95'] is not None else None,
+            "エラー率": f"{stats['error_rate']:.0%}",
+            "制限率": f"{stats['throttle_rate']:.0%}"
+        })
+    st.dataframe(rows, use_container_width=True, hide_index=True)
 
-### 📈 カテゴリ別評価（5段階）
-"""
-    
-    # 各カテゴリの5段階評価を動的に生成
-    for category in check_items.keys():
-        prompt += f"- **{category}**: ⭐⭐⭐⭐⭐ (X/5) - [簡潔な評価コメント]\n"
+def render_score(placeholder, score):
+    """評価点数をスコアに応じた色で表示"""
+    if score >= 80:
+        score_color = "🟢"
+        status = "優秀"
+    elif score >= 60:
+        score_color = "🟡"
+        status = "良好"
+    elif score >= 40:
+        score_color = "🟠"
+        status = "要改善"
+    else:
+        score_color = "🔴"
+        status = "要大幅改善"
     
-    prompt += """
-## ✅ 良い点
-- [具体的な良い点を列挙]
+    placeholder.success(f"{score_color} **総合評価: {score}/100点 ({status})**")
 
-## ⚠️ 改善が必要な点
-- [具体的な問題点を列挙]
+def render_approval(placeholder, approval):
+    """承認可否を表示"""
+    if approval == "○":
+        placeholder.success("✅ **承認可**: この稟議書は承認可能です")
+    elif approval == "△":
+        placeholder.warning("⚠️ **条件付き承認**: 修正後に承認可能です")
+    else:
+        placeholder.error("❌ **承認不可**: 大幅な修正が必要です")
 
-## 💡 具体的な改善提案
-- [実行可能な改善案を提示]
+def render_category_ratings(placeholder, ratings):
+    """カテゴリ別の5段階評価を表示"""
+    with placeholder.container():
+        columns = st.columns(max(len(ratings), 1))
+        for column, (category, rating) in zip(columns, ratings.items()):
+            column.metric(category, f"{'⭐' * round(rating)} {rating:g}/5")
 
-## 📋 チェック項目別詳細評価
+def render_summary(placeholders, parser, updated):
+    """ストリーム解析で確定した評価サマリーを表示枠に反映"""
+    if 'score' in updated:
+        render_score(placeholders['score'], parser.score)
+    if 'approval' in updated:
+        render_approval(placeholders['approval'], parser.approval)
+    if 'category_ratings' in updated:
+        render_category_ratings(placeholders['ratings'], parser.category_ratings)
 
-"""
+def run_consistency_check(client, model_name, prompt, samples, categories, max_tokens=None):
+    """同じプロンプトを複数回並列に実行し、評価を集計
+
+    各サンプルは中止可能な呼び出しとして実行し、新しいチェックの開始・再実行で中止する。
+    """
+    model_info = MODELS[model_name]
+    ctx = get_script_run_ctx()
     
-    # 各カテゴリの詳細評価セクションを動的に生成
-    total_categories = len(check_items)
-    points_per_category = 100 // total_categories
-    remaining_points = 100 % total_categories
+    selector = get_model_selector()
+    slots = get_call_slots()
     
-    for i, (category, items) in enumerate(check_items.items()):
-        # 最後のカテゴリに余りの点数を加算
-        category_points = points_per_category + (remaining_points if i == total_categories - 1 else 0)
+    def start_sample():
+        status = {}
         
-        prompt += f"""### {category} (X/{category_points}点)
-**該当部分の抜粋**:
-```
-[稟議書から該当する部分を抜粋]
-```
+        def stream(call):
+            start = time.monotonic()
+            yield from call_model_stream(
+                client,
+                model_info['model_id'],
+                model_info['provider'],
+                prompt,
+                max_tokens or model_info['max_tokens'],
+                0.3,
+                status,
+                call.attach
+            )
+            status['latency'] = time.monotonic() - start
+        
+        call = call_control.CancellableCall(
+            stream,
+            slots,
+            # ワーカースレッドからもエラー表示できるようにする
+            thread_setup=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+        ).start()
+        return call, status
+    
+    cancel_active_call()
+    calls = [start_sample() for _ in range(samples)]
+    st.session_state.active_calls = [call for call, _ in calls]
+    progress_placeholder = st.empty()
+    texts = []
+    try:
+        for call, status in calls:
+            for chunk in call:
+                if chunk is None:
+                    # 応答待ちの間も表示を更新し、中止・再実行の要求を受け付ける
+                    progress_placeholder.caption(
+                        f"⏳ {len(texts)}/{samples}サンプル完了（{time.monotonic() - call.started_at:.0f}秒 / "
+                        f"同時実行 {slots.in_use}/{slots.limit}）"
+                    )
+            error = status.get('error')
+            if error is not None:
+                st.error(f"{model_info['provider']} 呼び出しエラー: {error}")
+                outcome = "throttled" if model_selector.is_throttling_error(error) else "error"
+                selector.record(model_info['model_id'], time.monotonic() - call.started_at, outcome)
+                texts.append(None)
+                continue
+            selector.record(
+                model_info['model_id'],
+                status.get('latency', time.monotonic() - call.started_at),
+                "ok",
+                output_tokens=(status.get('usage') or {}).get('outputTokens') or token_budget.estimate_tokens(call.text)
+            )
+            texts.append(call.text)
+    finally:
+        for call, _ in calls:
+            if not call.finished:
+                call.cancel()
+                record_cancellation(call, model_name, notify=False)
+        if st.session_state.get('active_calls') == [call for call, _ in calls]:
+            del st.session_state.active_calls
+    progress_placeholder.empty()
+    
+    reports = [consistency.parse_report(text, categories) for text in texts if text]
+    return consistency.aggregate_reports(reports)
 
-**評価根拠**:
-- [なぜこの点数なのかの理由]
+def render_consistency_summary(placeholders, summary):
+    """一貫性チェックの集計結果を表示し、代表レポートのテキストを返す"""
+    if not summary['samples']:
+        return ""
+    
+    if summary['score'] is not None:
+        render_score(placeholders['score'], summary['score'])
+    if summary['approval']:
+        render_approval(placeholders['approval'], summary['approval'])
+    if summary['ratings']:
+        render_category_ratings(
+            placeholders['ratings'],
+            {category: stats['median'] for category, stats in summary['ratings'].items()}
+        )
+    
+    approval_votes = "、".join(
+        f"{approval}×{summary['approvals'].count(approval)}" for approval in dict.fromkeys(summary['approvals'])
+    )
+    st.caption(
+        f"🎯 {summary['samples']}サンプルの集計: 評価点数 中央値 {summary['score']}点"
+        f"（範囲 {min(summary['scores'], default=0)}〜{max(summary['scores'], default=0)}点, σ={summary['score_stdev']:.1f}） | "
+        f"承認可否 {approval_votes}（一致率 {summary['approval_agreement']:.0%}）"
+    )
+    if summary['unstable']:
+        st.warning("⚠️ **判定が不安定です**: " + " / ".join(summary['unstable']))
+    
+    with st.expander("📊 カテゴリ別のばらつき"):
+        rows = []
+        for category, stats in summary['ratings'].items():
+            points = summary['category_points'].get(category, {})
+            rows.append({
+                "カテゴリ": category,
+                "5段階評価（中央値）": stats['median'],
+                "5段階評価（幅）": stats['spread'],
+                "点数（中央値）": points.get('median'),
+                "点数（幅）": points.get('spread')
+            })
+        st.dataframe(rows, use_container_width=True)
+    
+    return summary['representative']['text'] if summary['representative'] else ""
 
-**推奨修正案**:
-- [具体的な修正提案]
+def create_check_prompt(ringi_text, check_items, reference=None, evidence=None,
+                        report_profile=token_budget.DEFAULT_REPORT_PROFILE):
+    """稟議書チェック用のプロンプトを作成
 
-"""
-    
-    prompt += """## 🚨 重要な指摘事項
-- [承認に影響する重要な問題点]
+    固定部分はチェック項目の設定とレポートの詳細度ごとにキャッシュしたテンプレートを使い、
+    稟議書の内容（または関連箇所の抜粋）だけを差し込む。
+    """
+    return prompt_templates.get_check_template(check_items, report_profile).render(ringi_text, reference, evidence)
 
-## 📝 修正版サンプル（重要部分のみ）
-```
-[最も重要な修正箇所について、修正後のサンプルテキストを提示]
-```
+def check_context_fits(prompt, model_info, max_tokens):
+    """推定入力トークン数がモデルのコンテキスト長に収まるかを確認し、収まらない場合は表示
 
-必ず最初の総合評価で承認可否と各カテゴリの5段階評価（⭐で表現）を含めてください。
-"""
+    Returns:
+        tuple: (送信可否, 推定入力トークン数)
+    """
+    input_tokens = get_token_estimator().estimate(prompt, model_info['model_id'])
+    window = model_info.get('context_window')
+    status = token_budget.context_status(input_tokens, max_tokens, window)
+    if status == "over":
+        st.error(
+            f"❌ 入力が長すぎます（推定 {input_tokens:,} トークン / コンテキスト長 {window:,} トークン）。"
+            "「関連箇所のみ送信」を有効にするか、稟議書を分割してください。"
+        )
+        return False, input_tokens
+    if status == "tight":
+        st.warning(
+            f"⚠️ 入力が長いため、出力がコンテキスト長の残り（約 {window - input_tokens:,} トークン）で"
+            "打ち切られる可能性があります"
+        )
+    return True, input_tokens
+
+def run_batch_check(uploaded_files, client, check_items, model_candidates, options, placeholders):
+    """複数の PDF を抽出 → モデル呼び出しのパイプラインで処理し、結果を返す"""
+    ctx = get_script_run_ctx()
+    slots = get_call_slots()
+    categories = list(check_items.keys())
+    max_tokens = token_budget.output_budget(len(check_items), options['report_profile'])
+    first_model = MODELS[model_candidates[0]]
+    
+    def extract(uploaded_file, cancel_event):
+        stats = {}
+        pages = pdf_extraction.extract_pages(uploaded_file, stats, tables=options['extract_tables'])
+        if options['use_ocr'] and stats['empty_pages']:
+            for page_number, text in get_ocr_engine().ocr_pages(uploaded_file, stats['empty_pages']):
+                pages[page_number - 1] = text
+        if options['compact_text']:
+            pages, _ = text_compaction.compact_pages(pages)
+        pages = [clean_extracted_text(page) for page in pages]
+        text = "\n".join(page for page in pages if page).strip()
+        if not text:
+            raise ValueError("PDFからテキストを抽出できませんでした")
+        return {'name': uploaded_file.name, 'text': text, 'pages': pages}
+    
+    def check(extracted, cancel_event):
+        evidence = None
+        if options['use_evidence']:
+            segments, assignments = evidence_index.select_evidence(
+                extracted['pages'], check_items, options['evidence_top_k']
+            )
+            if segments:
+                evidence = evidence_index.format_evidence(segments, assignments)
+        prompt = create_check_prompt(extracted['text'], check_items, None, evidence, options['report_profile'])
+        input_tokens = get_token_estimator().estimate(prompt, first_model['model_id'])
+        if token_budget.context_status(input_tokens, 0, first_model.get('context_window')) == "over":
+            return {'error': f"入力が長すぎます（推定 {input_tokens:,} トークン）"}
+        status = {}
+        # 一括チェックの中止で、応答待ち・生成中の呼び出しもすぐに打ち切る
+        call = call_control.CancellableCall(
+            lambda call: stream_with_failover(
+                client, model_candidates, prompt, status, max_tokens, call, extracted['name']
+            ),
+            slots,
+            thread_setup=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+        ).start()
+        for _ in call:
+            if cancel_event.is_set():
+                call.cancel()
+                break
+        text = call.text
+        if call.cancelled:
+            error = "中止しました"
+        elif status.get('error') is not None:
+            error = f"{status.get('model')} 呼び出しエラー: {status['error']}"
+        elif not text:
+            error = "応答を取得できませんでした"
+        else:
+            error = None
+        report = consistency.parse_report(text, categories)
+        return {
+            'text': text,
+            'score': report['score'],
+            'approval': report['approval'],
+            'model': status.get('model'),
+            'error': error
+        }
+    
+    pipeline = batch_pipeline.BatchPipeline(
+        extract,
+        check,
+        check_workers=options['check_workers'],
+        # ワーカースレッドからもエラー表示できるようにする
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+    ).start(uploaded_files, [uploaded_file.name for uploaded_file in uploaded_files])
+    archive = batch_pipeline.ResultArchive()
+    archived = set()
+    start = time.monotonic()
+    last_render = 0.0
+    try:
+        for index in pipeline.updates():
+            if index is not None:
+                job = pipeline.jobs[index]
+                # 完了したファイルから順に zip・CSV に書き込む
+                if job['status'] in (batch_pipeline.STATUS_DONE, batch_pipeline.STATUS_ERROR) and index not in archived:
+                    archive.add(job)
+                    archived.add(index)
+            # 表示の更新は間引いて送信量を抑える（待機中も更新し、中止・再実行の要求を受け付ける）
+            if time.monotonic() - last_render > 0.3:
+                placeholders['table'].dataframe(
+                    [batch_pipeline.job_row(job) for job in pipeline.jobs],
+                    use_container_width=True, hide_index=True
+                )
+                placeholders['progress'].caption(
+                    f"⏳ 完了 {len(archived)}/{len(pipeline.jobs)}件 "
+                    f"（{time.monotonic() - start:.0f}秒 / 同時実行 {slots.in_use}/{slots.limit}）"
+                )
+                last_render = time.monotonic()
+    finally:
+        if not pipeline.finished:
+            pipeline.cancel()
+        pipeline.close()
+    placeholders['progress'].empty()
     
-    return prompt
+    return {
+        'rows': [batch_pipeline.job_row(job) for job in pipeline.jobs],
+        'texts': [(job['name'], job['result']['text']) for job in pipeline.jobs if job['result'] and job['result'].get('text')],
+        'csv': archive.csv_bytes(),
+        'zip': archive.zip_bytes(),
+        'elapsed': time.monotonic() - start,
+        'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S")
+    }
+
+def render_batch_check(check_items, model_candidates, use_evidence, evidence_top_k, report_profile):
+    """複数PDFの一括チェック画面"""
+    st.markdown("### 複数のPDFファイルをアップロード")
+    uploaded_files = st.file_uploader(
+        "稟議書のPDFファイルを選択してください（複数可）",
+        type=['pdf'],
+        accept_multiple_files=True,
+        help="抽出とAI分析をパイプラインで並行して進めます"
+    )
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        compact_text = st.checkbox("🧹 繰り返し行を除去", value=True, key="batch_compact_text")
+    with col2:
+        extract_tables = st.checkbox("📊 表を認識して整形", value=True, key="batch_extract_tables")
+    with col3:
+        ocr_ready, ocr_reason = check_ocr_available()
+        use_ocr = st.checkbox(
+            "🔎 スキャンPDFをOCR", value=ocr_ready, disabled=not ocr_ready, key="batch_use_ocr",
+            help=ocr_reason
+        )
+    with col4:
+        check_workers = st.number_input(
+            "同時分析数", min_value=1, max_value=16, value=batch_pipeline.CHECK_WORKERS,
+            help="同時にモデルを呼び出すファイル数（プロセス全体の同時実行枠も適用されます）"
+        )
+    
+    check_button = st.button(
+        f"🔍 {len(uploaded_files)}件を一括チェック" if uploaded_files else "🔍 一括チェック",
+        type="primary",
+        disabled=not uploaded_files
+    )
+    st.caption("一括チェックでは類似稟議書の再利用と一貫性チェックは行いません")
+    
+    placeholders = {'table': st.empty(), 'progress': st.empty()}
+    
+    if check_button:
+        client = initialize_bedrock_client()
+        if client is None:
+            return
+        st.session_state.batch_result = run_batch_check(
+            uploaded_files, client, check_items, model_candidates,
+            {
+                'compact_text': compact_text,
+                'extract_tables': extract_tables,
+                'use_ocr': use_ocr,
+                'check_workers': check_workers,
+                'use_evidence': use_evidence,
+                'evidence_top_k': evidence_top_k,
+                'report_profile': report_profile
+            },
+            placeholders
+        )
+    
+    batch_result = st.session_state.get('batch_result')
+    if batch_result:
+        placeholders['table'].dataframe(batch_result['rows'], use_container_width=True, hide_index=True)
+        done = sum(1 for row in batch_result['rows'] if row["状態"] == batch_pipeline.STATUS_DONE)
+        st.caption(f"✅ {done}/{len(batch_result['rows'])}件完了（{batch_result['elapsed']:.0f}秒）")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="📦 結果をまとめてダウンロード（zip）",
+                data=batch_result['zip'],
+                file_name=f"稟議書チェック結果_{batch_result['timestamp']}.zip",
+                mime="application/zip"
+            )
+        with col2:
+            st.download_button(
+                label="📊 結果一覧をダウンロード（CSV）",
+                data=batch_result['csv'],
+                file_name=f"稟議書チェック結果一覧_{batch_result['timestamp']}.csv",
+                mime="text/csv"
+            )
+        
+        for name, text in batch_result['texts']:
+            with st.expander(f"📄 {name}"):
+                st.markdown(text)
 
 def main():
+    # Bedrock クライアントの作成・事前接続を開始（初回のみ）
+    get_bedrock_warmer()
+    
     # タイトル
     st.title("📋 稟議書チェッカー")
     st.markdown("AI を活用して稟議書の品質をチェックし、改善提案を行います")
     st.markdown("---")
     
-    # チェック項目を初期化
-    check_items = initialize_check_items()
-    
     # サイドバー設定
     with st.sidebar:
         st.header("⚙️ 設定")
@@ -330,11 +832,28 @@ def main():
         # チェック項目編集
         st.subheader("📋 チェック項目設定")
         
+        # 部署ごとのチェック項目プロファイル
+        profile_store = get_profile_store()
+        profile_names = profile_store.list_profiles()
+        if check_item_store.DEFAULT_PROFILE not in profile_names:
+            profile_names.insert(0, check_item_store.DEFAULT_PROFILE)
+        profile_name = st.selectbox("🏢 プロファイル", profile_names, help="部署ごとのチェック項目の設定")
+        
+        # チェック項目を初期化
+        profile = load_check_items_profile(profile_name)
+        check_items = initialize_check_items(profile_name, profile)
+        if 'check_items' in st.session_state:
+            st.caption(f"✏️ 版 {st.session_state.check_items_base_version} を編集中（未保存）")
+        else:
+            st.caption(f"版 {profile['version']}" + (f"（{profile['updated_at']} 更新）" if profile['updated_at'] else "（デフォルト）"))
+        
         # チェック項目編集モード
         edit_mode = st.checkbox("✏️ チェック項目を編集", help="独自のチェック項目を設定できます")
         
         if edit_mode:
             st.markdown("### チェック項目編集")
+            if 'check_items' not in st.session_state:
+                check_items = start_check_items_draft(profile)
             
             # 既存カテゴリの編集
             categories_to_delete = []
@@ -402,29 +921,41 @@ def main():
             
             # 設定の保存・読み込み
             st.markdown("### 設定の保存・読み込み")
+            save_as = st.text_input("保存先プロファイル", value=profile_name, help="部署名などを入力すると新しいプロファイルとして保存します")
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                if st.button("💾 設定を保存"):
-                    if save_check_items_to_file(check_items):
-                        st.success("設定を保存しました")
+                if st.button("💾 設定を保存") and save_as.strip():
+                    base_version = st.session_state.check_items_base_version if save_as == profile_name else None
+                    saved = save_check_items_profile(save_as.strip(), check_items, base_version)
+                    if saved:
+                        st.success(f"「{save_as}」の版 {saved['version']} として保存しました")
             
             with col2:
-                if st.button("📂 設定を読み込み"):
-                    loaded_items = load_check_items_from_file()
-                    if loaded_items:
-                        st.session_state.check_items = loaded_items
-                        st.success("設定を読み込みました")
-                        st.rerun()
+                if st.button("📂 最新を読み込み"):
+                    discard_check_items_draft()
+                    st.success("保存済みの最新の設定を読み込みました")
+                    st.rerun()
             
             with col3:
                 if st.button("🔄 デフォルトに戻す"):
-                    st.session_state.check_items = DEFAULT_CHECK_ITEMS.copy()
+                    start_check_items_draft(profile, DEFAULT_CHECK_ITEMS)
                     st.success("デフォルト設定に戻しました")
                     st.rerun()
             
-            # セッションに保存
-            st.session_state.check_items = check_items
+            # 過去の版の読み込み
+            versions = profile_store.versions(profile_name)
+            if versions:
+                col1, col2 = st.columns([2, 1])
+                with col1:
+                    version = st.selectbox("🕘 過去の版", versions, format_func=lambda v: f"版 {v}")
+                with col2:
+                    if st.button("読み込み", key="load_version"):
+                        try:
+                            start_check_items_draft(profile, profile_store.get_version(profile_name, version))
+                            st.rerun()
+                        except check_item_store.ProfileLoadError as e:
+                            st.error(f"読み込みエラー: {e}")
         
         else:
             # チェック項目表示（編集モードでない場合）
@@ -441,21 +972,125 @@ def main():
         
         # モデル選択
         st.subheader("🤖 AIモデル選択")
-        selected_model = st.selectbox(
-            "使用するモデル",
-            options=list(MODELS.keys()),
-            format_func=lambda x: f"{MODELS[x]['icon']} {x}",
-            help="用途に応じてモデルを選択してください"
+        selector = get_model_selector()
+        selection_mode = st.radio(
+            "選択方法",
+            ["手動", "自動（ティア）", "自動（目標レイテンシ）"],
+            horizontal=True,
+            help="自動選択では実測レイテンシ・エラー率をもとにモデルを選び、スロットリング時は次のモデルに切り替えます"
         )
         
+        if selection_mode == "手動":
+            selected_model = st.selectbox(
+                "使用するモデル",
+                options=list(MODELS.keys()),
+                format_func=lambda x: f"{MODELS[x]['icon']} {x}",
+                help="用途に応じてモデルを選択してください"
+            )
+            model_candidates = [selected_model]
+        else:
+            if selection_mode == "自動（ティア）":
+                tier = st.select_slider(
+                    "ティア",
+                    options=list(model_selector.TIER_LABELS.keys()),
+                    value="balanced",
+                    format_func=lambda x: model_selector.TIER_LABELS[x]
+                )
+                model_candidates = selector.rank_models(MODELS, tier=tier)
+            else:
+                sla_seconds = st.slider("目標レイテンシ（p95, 秒）", 5, 120, 30, 5)
+                model_candidates = selector.rank_models(MODELS, sla_seconds=sla_seconds)
+            selected_model = model_candidates[0]
+            st.caption("優先順: " + " → ".join(f"{MODELS[name]['icon']} {name}" for name in model_candidates))
+        
         model_info = MODELS[selected_model]
         st.info(f"**{selected_model}** ({model_info['provider']})\n\n{model_info['description']}")
+        
+        # レポートの詳細度（カテゴリ数と合わせて出力トークン数の上限を決める）
+        report_profile = st.radio(
+            "📝 レポートの詳細度",
+            list(token_budget.REPORT_PROFILES.keys()),
+            index=list(token_budget.REPORT_PROFILES.keys()).index(token_budget.DEFAULT_REPORT_PROFILE),
+            format_func=lambda x: token_budget.REPORT_PROFILES[x]['label'],
+            horizontal=True,
+            help="簡潔にするほど出力が短くなり、応答が速くなります"
+        )
+        max_tokens = token_budget.output_budget(len(check_items), report_profile, model_info['max_tokens'])
+        st.caption(f"🔢 出力上限 {max_tokens:,} トークン（{len(check_items)}カテゴリ）")
+        
+        with st.expander("🚀 起動時間"):
+            st.dataframe(get_startup_report().rows(), use_container_width=True, hide_index=True)
+            st.caption("🟢 Bedrock に事前接続済み" if get_bedrock_warmer().connected else "⏳ Bedrock に接続準備中")
+        
+        with st.expander("📈 モデルの実測パフォーマンス"):
+            render_model_stats(selector)
+            cancellation_stats = get_cancellation_stats()
+            slots = get_call_slots()
+            st.caption(
+                f"同時実行 {slots.in_use}/{slots.limit} | "
+                f"中止 {cancellation_stats.cancelled_calls}件（回避 約{cancellation_stats.avoided_tokens:,}トークン）"
+            )
+        
+        consistency_mode = st.checkbox(
+            "🎯 一貫性チェック（複数回並列に評価）",
+            value=False,
+            help="同じ稟議書を複数回並列に評価し、中央値・ばらつき・多数決で集計して不安定な判定を検出します"
+        )
+        consistency_samples = st.number_input(
+            "サンプル数",
+            min_value=2,
+            max_value=10,
+            value=model_info['consistency_samples'],
+            disabled=not consistency_mode,
+            help="モデルごとのデフォルト値が設定されています"
+        )
+        
+        stop_after_summary = st.checkbox(
+            "⏱️ 総合評価が出たら生成を停止",
+            value=False,
+            help="トリアージ用: 評価点数・承認可否・カテゴリ別評価が揃った時点で生成を打ち切ります"
+        )
+        
+        st.markdown("---")
+        
+        # 関連箇所の抜粋設定
+        use_evidence = st.checkbox(
+            "📑 チェック観点ごとの関連箇所のみ送信",
+            value=False,
+            help="稟議書を見出しごとのセクションに分割し、各チェック観点に関連する上位のセクションだけをページ番号付きで送信します（長文の稟議書向け）"
+        )
+        evidence_top_k = st.number_input(
+            "観点ごとのセクション数",
+            min_value=1,
+            max_value=10,
+            value=evidence_index.DEFAULT_TOP_K,
+            disabled=not use_evidence
+        )
+        
+        st.markdown("---")
+        
+        # 類似稟議書の再利用設定
+        st.subheader("♻️ 類似稟議書の再利用")
+        use_similarity = st.checkbox(
+            "過去のチェック結果を活用",
+            value=True,
+            help="テンプレートが同じで数行だけ異なる稟議書は、過去の結果を再利用または差分チェックします"
+        )
+        similarity_threshold = st.slider(
+            "類似判定のしきい値",
+            0.5, 1.0, DEFAULT_SIMILARITY_THRESHOLD, 0.01,
+            disabled=not use_similarity,
+            help="この類似度以上の過去チェックを、差分と合わせてモデルに渡します"
+        )
+        reuse_threshold = st.slider(
+            "結果をそのまま再利用するしきい値",
+            similarity_threshold, 1.0, max(DEFAULT_REUSE_THRESHOLD, similarity_threshold), 0.01,
+            disabled=not use_similarity,
+            help="この類似度以上の場合、モデルを呼び出さずに過去の結果を表示します"
+        )
     
-    # Bedrock クライアント初期化
-    if 'bedrock_client' not in st.session_state:
-        st.session_state.bedrock_client = initialize_bedrock_client()
-    
-    if st.session_state.bedrock_client is None:
+    # Bedrock クライアント（作成に失敗した場合のみ中断し、作成中なら待たずに画面を表示）
+    if get_bedrock_warmer().error is not None:
         st.error("AWS Bedrock に接続できません。認証情報を確認してください。")
         st.info("以下のコマンドで認証情報を設定してください：\n```bash\naws configure\n```")
         return
@@ -466,11 +1101,17 @@ def main():
     # 入力方法選択
     input_method = st.radio(
         "入力方法を選択",
-        ["📄 PDFアップロード", "✏️ テキスト入力"],
+        ["📄 PDFアップロード", "📚 複数PDFの一括チェック", "✏️ テキスト入力"],
         horizontal=True
     )
     
+    if input_method == "📚 複数PDFの一括チェック":
+        render_batch_check(check_items, model_candidates, use_evidence, evidence_top_k, report_profile)
+        return
+    
     ringi_text = ""
+    # ページごとのテキスト（PDF から抽出し、編集していない場合のみ）
+    ringi_pages = None
     
     if input_method == "📄 PDFアップロード":
         st.markdown("### PDFファイルをアップロード")
@@ -485,13 +1126,82 @@ def main():
             st.info(f"📁 ファイル名: {uploaded_file.name}")
             st.info(f"📊 ファイルサイズ: {uploaded_file.size:,} bytes")
             
+            compact_text = st.checkbox(
+                "🧹 ヘッダー・フッター・押印欄などの繰り返しを除去",
+                value=True,
+                help="全ページに繰り返し出現する行やページ番号、罫線ノイズを除去して入力トークンを削減します"
+            )
+            extract_tables = st.checkbox(
+                "📊 表を認識して整形（費用の内訳など）",
+                value=True,
+                help="表をMarkdown形式に変換し、金額列の合計を事前に計算してプロンプトに含めます"
+            )
+            ocr_ready, ocr_reason = check_ocr_available()
+            use_ocr = st.checkbox(
+                "🔎 テキストのないページをOCR（スキャンPDF）",
+                value=ocr_ready,
+                disabled=not ocr_ready,
+                help="テキスト層のないページだけを画像化して Tesseract で文字認識します"
+                + (f"（利用不可: {ocr_reason}）" if ocr_reason else "")
+            )
+            
             # PDFからテキスト抽出
+            extraction_stats = {}
+            extracted_text = None
             with st.spinner("PDFからテキストを抽出中..."):
-                extracted_text = extract_text_from_pdf(uploaded_file)
+                pages = extract_pages_from_pdf(uploaded_file, extraction_stats, extract_tables)
+            if 'library_import_seconds' in extraction_stats:
+                get_startup_report().record("PDF ライブラリの読み込み（初回アップロード時）", extraction_stats['library_import_seconds'])
+            
+            # テキストのないページを OCR（同じファイルの結果はセッション内で再利用）
+            if pages and use_ocr and extraction_stats.get('empty_pages'):
+                ocr_cache = st.session_state.get('ocr_cache')
+                if not ocr_cache or ocr_cache['file_id'] != uploaded_file.file_id:
+                    progress = st.progress(0.0, text="🔎 OCR を開始しています...")
+                    ocr_stats = ocr_empty_pages(uploaded_file, pages, extraction_stats['empty_pages'], progress)
+                    progress.empty()
+                    ocr_cache = {
+                        'file_id': uploaded_file.file_id,
+                        'pages': {n: pages[n - 1] for n in extraction_stats['empty_pages']},
+                        'stats': ocr_stats
+                    }
+                    st.session_state.ocr_cache = ocr_cache
+                else:
+                    for page_number, text in ocr_cache['pages'].items():
+                        pages[page_number - 1] = text
+                ocr_stats = ocr_cache['stats']
+                if ocr_stats.get('ocr_pages'):
+                    st.caption(
+                        f"🔎 OCR: {ocr_stats['ocr_pages']}ページ（うちキャッシュ {ocr_stats['ocr_cached']}ページ）"
+                        f" {ocr_stats['ocr_elapsed']:.1f}秒, {ocr_stats['pages_per_second']:.2f}ページ/秒"
+                    )
+            
+            if pages:
+                if compact_text:
+                    pages, compaction_report = text_compaction.compact_pages(pages)
+                    if compaction_report['removed_chars'] > 0:
+                        st.caption(
+                            f"🧹 繰り返し行・罫線ノイズを除去: {compaction_report['removed_chars']:,}文字"
+                            f"（推定 {compaction_report['removed_tokens']:,} トークン, "
+                            f"{compaction_report['removed_lines']}行）を削減しました"
+                        )
+                extracted_text = "\n".join(page for page in pages if page).strip()
+            
+            if extraction_stats.get('pages_read') is not None:
+                st.caption(
+                    f"📄 {extraction_stats['pages_read']}/{extraction_stats['pages_total']}ページ抽出"
+                    f"（{extraction_stats['engine']}, {extraction_stats['elapsed']:.1f}秒） | "
+                    f"🧠 ピークRSS: {extraction_stats['peak_rss_bytes'] / (1024 * 1024):,.0f}MB"
+                    f"（+{extraction_stats['rss_increase_bytes'] / (1024 * 1024):,.0f}MB）"
+                    + (f" | 📊 表: {extraction_stats['tables']}件" if extraction_stats.get('tables') else "")
+                )
+            if extraction_stats.get('truncated'):
+                st.warning(f"⚠️ {extraction_stats['truncated']}に達したため、途中で抽出を打ち切りました")
             
             if extracted_text:
                 cleaned_text = clean_extracted_text(extracted_text)
                 ringi_text = cleaned_text
+                ringi_pages = [clean_extracted_text(page) for page in pages]
                 
                 # 抽出結果のプレビュー
                 with st.expander("📖 抽出されたテキストのプレビュー"):
@@ -511,6 +1221,8 @@ def main():
                         height=300,
                         help="必要に応じて抽出されたテキストを修正してください"
                     )
+                    if ringi_text != cleaned_text:
+                        ringi_pages = None
             else:
                 st.error("PDFからテキストを抽出できませんでした。手動でテキストを入力してください。")
     
@@ -576,62 +1288,180 @@ def main():
         help="稟議書の内容をAIが詳細に分析します"
     )
     
+    # 前回の実行で中止した呼び出しの通知
+    cancelled = st.session_state.pop('last_cancelled', None)
+    if cancelled:
+        st.info(
+            f"⏹ {cancelled['model']} の分析を {cancelled['elapsed']:.0f}秒で中止しました"
+            f"（生成済み 約{cancelled['generated_tokens']:,}トークン / 回避 約{cancelled['avoided_tokens']:,}トークン）"
+        )
+    
     # チェック結果表示（下に配置）
     if check_button and ringi_text.strip():
         st.markdown("---")
         st.subheader("📊 チェック結果")
         
-        # プロンプト作成
-        prompt = create_check_prompt(ringi_text, check_items)
-        
-        # AI分析実行
-        with st.spinner(f"{selected_model} が稟議書を分析中..."):
-            result = call_model(
-                st.session_state.bedrock_client,
-                model_info['model_id'],
-                model_info['provider'],
-                prompt,
-                model_info['max_tokens'],
-                0.3  # 低めのtemperatureで一貫性を重視
+        # 類似した過去のチェックを検索
+        similar, similarity, signature, similarity_key = (None, 0.0, None, None)
+        if use_similarity:
+            similarity_key = similarity_context_key(
+                selected_model, check_items, report_profile, evidence_top_k if use_evidence else None
+            )
+            similar, similarity, signature, similarity_key = find_similar_check(
+                ringi_text, similarity_key, similarity_threshold
             )
         
-        if result:
-            # 結果表示
-            st.markdown(result)
+        # 評価サマリーの表示枠（ストリーミング中に確定した順に更新）
+        placeholders = {
+            'score': st.empty(),
+            'approval': st.empty(),
+            'ratings': st.empty()
+        }
+        result_placeholder = st.empty()
+        parser = ReportStreamParser(check_items.keys())
+        stopped_early = False
+        
+        reference = None
+        reused = similar is not None and similarity >= reuse_threshold
+        if reused:
+            st.info(f"♻️ 類似度 {similarity:.0%} の過去チェック（{similar['created_at']}）の結果を再利用しました")
+            result = similar['result']
+            render_summary(placeholders, parser, parser.feed(result) | parser.close())
+        else:
+            if similar is not None:
+                reference = {
+                    'similarity': similarity,
+                    'result': similar['result'],
+                    'diff': ringi_similarity.make_diff(similar['text'], ringi_text)
+                }
+                st.info(f"♻️ 類似度 {similarity:.0%} の過去チェック（{similar['created_at']}）との差分を参考にチェックします")
             
-            # 結果の要約を抽出して表示
-            if "評価点数" in result or "評価:" in result:
-                # 評価点数を抽出
-                score_match = re.search(r'(\d+)/100点', result)
-                if score_match:
-                    score = int(score_match.group(1))
-                    
-                    # スコアに応じた色分け
-                    if score >= 80:
-                        score_color = "🟢"
-                        status = "優秀"
-                    elif score >= 60:
-                        score_color = "🟡"
-                        status = "良好"
-                    elif score >= 40:
-                        score_color = "🟠"
-                        status = "要改善"
-                    else:
-                        score_color = "🔴"
-                        status = "要大幅改善"
-                    
-                    st.success(f"{score_color} **総合評価: {score}/100点 ({status})**")
+            bedrock_client = initialize_bedrock_client()
+            if bedrock_client is None:
+                return
             
-            # 承認可否を抽出して表示
-            approval_match = re.search(r'承認可否[：:]\s*([○△×])', result)
-            if approval_match:
-                approval = approval_match.group(1)
-                if approval == "○":
-                    st.success("✅ **承認可**: この稟議書は承認可能です")
-                elif approval == "△":
-                    st.warning("⚠️ **条件付き承認**: 修正後に承認可能です")
-                else:
-                    st.error("❌ **承認不可**: 大幅な修正が必要です")
+            # チェック観点ごとの関連箇所を抜粋
+            evidence = None
+            if use_evidence:
+                segments, assignments = evidence_index.select_evidence(
+                    ringi_pages or [ringi_text], check_items, evidence_top_k
+                )
+                if segments:
+                    evidence = evidence_index.format_evidence(segments, assignments)
+                    st.caption(
+                        f"📑 関連箇所 {len(segments)}セクションを送信"
+                        f"（約 {token_budget.estimate_tokens(ringi_text):,} → "
+                        f"{token_budget.estimate_tokens(evidence):,} トークン）"
+                    )
+            
+            # プロンプト作成
+            prompt = create_check_prompt(ringi_text, check_items, reference, evidence, report_profile)
+            
+            # 送信前にコンテキスト長に収まるかを確認
+            fits, input_tokens = check_context_fits(prompt, model_info, max_tokens)
+            if not fits:
+                return
+            
+            if consistency_mode:
+                # 一貫性チェック（同じプロンプトを複数回並列に実行して集計）
+                with st.spinner(f"{selected_model} が {consistency_samples} 回並列に稟議書を分析中..."):
+                    summary = run_consistency_check(
+                        bedrock_client,
+                        selected_model,
+                        prompt,
+                        consistency_samples,
+                        list(check_items.keys()),
+                        max_tokens
+                    )
+                result = render_consistency_summary(placeholders, summary)
+                parser.score = summary['score']
+                parser.approval = summary['approval']
+            else:
+                # AI分析実行（ストリーミングで逐次表示）
+                result = ""
+                call_status = {}
+                last_render = 0.0
+                cancel_active_call()
+                ctx = get_script_run_ctx()
+                slots = get_call_slots()
+                call = call_control.CancellableCall(
+                    lambda call: stream_with_failover(
+                        bedrock_client,
+                        model_candidates,
+                        prompt,
+                        call_status,
+                        max_tokens,
+                        call
+                    ),
+                    slots,
+                    # ワーカースレッドからもエラー表示できるようにする
+                    thread_setup=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+                ).start()
+                st.session_state.active_calls = [call]
+                # 押すと再実行が発生し、実行中の呼び出しは下の finally で中止される
+                st.button("⏹ 中止", key="cancel_check")
+                progress_placeholder = st.empty()
+                with st.spinner(f"{selected_model} が稟議書を分析中..."):
+                    try:
+                        for chunk in call:
+                            if chunk is None:
+                                # 応答待ちの間も表示を更新し、中止・再実行の要求を受け付ける
+                                waiting = "同時実行枠の空き待ち" if call.waiting_for_slot else "応答待ち"
+                                progress_placeholder.caption(
+                                    f"⏳ {waiting}（{time.monotonic() - call.started_at:.0f}秒 / "
+                                    f"同時実行 {slots.in_use}/{slots.limit}）"
+                                )
+                                continue
+                            result += chunk
+                            render_summary(placeholders, parser, parser.feed(chunk))
+                            if stop_after_summary and parser.summary_complete:
+                                stopped_early = True
+                                break
+                            # 表示の更新は間引いて送信量を抑える
+                            if time.monotonic() - last_render > 0.1:
+                                result_placeholder.markdown(result + "▌")
+                                last_render = time.monotonic()
+                    finally:
+                        if not call.finished:
+                            call.cancel()
+                            record_cancellation(call, call_status.get('model', selected_model), notify=not stopped_early)
+                        if st.session_state.get('active_calls') == [call]:
+                            del st.session_state.active_calls
+                progress_placeholder.empty()
+                render_summary(placeholders, parser, parser.close())
+                
+                if call_status.get('model', selected_model) != selected_model:
+                    selected_model = call_status['model']
+                    st.caption(f"🤖 {selected_model} で分析しました")
+                
+                usage = call_status.get('usage') or {}
+                if usage.get('inputTokens') is not None and usage.get('outputTokens') is not None:
+                    st.caption(
+                        f"🔢 入力 {usage['inputTokens']:,} トークン（推定 {input_tokens:,}） / "
+                        f"出力 {usage['outputTokens']:,} トークン"
+                    )
+                if call_status.get('stop_reason') == "max_tokens" and not stopped_early:
+                    st.warning("⚠️ 出力トークン数の上限に達したため、結果が途中で切れています。レポートの詳細度を上げると上限が増えます")
+            
+            if stopped_early:
+                st.info("⏹ 総合評価の取得後に生成を停止しました（トリアージモード）")
+            
+            # 次回以降の類似検索のために登録（フェイルオーバー時は実際に応答したモデルのキーで登録）
+            if result and use_similarity and not stopped_early:
+                try:
+                    get_similarity_index().add(
+                        ringi_text, result,
+                        similarity_context_key(
+                            selected_model, check_items, report_profile, evidence_top_k if use_evidence else None
+                        ),
+                        model=selected_model, signature=signature
+                    )
+                except Exception as e:
+                    st.warning(f"チェック結果の登録に失敗しました: {e}")
+        
+        if result:
+            # 結果表示
+            result_placeholder.markdown(result)
             
             # 結果をセッションに保存
             st.session_state.last_result = {
@@ -640,8 +1470,8 @@ def main():
                 'model': selected_model,
                 'input_method': input_method,
                 'char_count': len(ringi_text),
-                'score': score_match.group(1) if score_match else "N/A",
-                'approval': approval_match.group(1) if approval_match else "N/A"
+                'score': str(parser.score) if parser.score is not None else "N/A",
+                'approval': parser.approval or "N/A"
             }
             
             # ダウンロードボタン
@@ -687,7 +1517,7 @@ def main():
         
         **対応PDFファイル**:
         - テキストベースのPDF
-        - スキャンされた画像PDFは非対応
+        - スキャンされた画像PDF（Tesseract と日本語モデルがある場合のみ OCR で対応）
         - ファイルサイズ: 200MB以下推奨
         """)
     
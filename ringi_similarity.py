@@ -0,0 +1,239 @@
+import difflib
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+import numpy as np
+
+# MinHash 設定
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+LSH_BANDS = 32
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# ハッシュ関数のパラメータ（プロセス間・再起動後も同じ値になるよう固定シード）
+_rng = random.Random(20240620)
+_PERMUTATIONS = [
+    (_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+# a を上位・下位 32 ビットに分けた値（64 ビット整数の範囲で (a * x + b) mod p を正確に計算するため）
+_PERM_A_HIGH = np.array([a >> 32 for a, _ in _PERMUTATIONS], dtype=np.uint64)
+_PERM_A_LOW = np.array([a & 0xFFFFFFFF for a, _ in _PERMUTATIONS], dtype=np.uint64)
+_PERM_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)
+# 一度に計算するシングル数（メモリ使用量を抑える）
+_MINHASH_CHUNK = 4096
+# これより多くのシングルがある長文は、ハッシュ値の小さいシングルだけを使う
+MAX_SHINGLES = 16384
+
+DEFAULT_DB_PATH = os.environ.get("RINGI_HISTORY_DB", "ringi_history.db")
+
+
+def normalize_text(text):
+    """類似度計算用に空白を除去して正規化"""
+    return re.sub(r'\s+', '', text or "")
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """文字 n-gram（シングル）のハッシュ集合を作成"""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {zlib.crc32(text.encode('utf-8'))} if text else set()
+    return {
+        zlib.crc32(text[i:i + size].encode('utf-8'))
+        for i in range(len(text) - size + 1)
+    }
+
+
+def _mod_mersenne(values):
+    """2^64 未満の値の 2^61 - 1 による剰余"""
+    values = (values & np.uint64(_MERSENNE_PRIME)) + (values >> np.uint64(61))
+    return np.where(values >= np.uint64(_MERSENNE_PRIME), values - np.uint64(_MERSENNE_PRIME), values)
+
+
+def _permuted_hashes(x):
+    """シングルのハッシュ（列ベクトル）に全ハッシュ関数 (a * x + b) mod p を適用した行列"""
+    # a * x = a_high * x * 2^32 + a_low * x。a_high * x = t1 * 2^29 + t0 と分けると、
+    # 2^61 ≡ 1 (mod p) より a_high * x * 2^32 ≡ t1 + t0 * 2^32 となり、各項が 64 ビットに収まる
+    # （各項は 2^61 程度以下のため、合計しても 64 ビットを超えない）
+    high = _PERM_A_HIGH * x
+    high = (high >> np.uint64(29)) + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+    low = _PERM_A_LOW * x
+    low = (low & np.uint64(_MERSENNE_PRIME)) + (low >> np.uint64(61))
+    return _mod_mersenne(high + low + _PERM_B)
+
+
+def minhash_signature(text):
+    """テキストの MinHash シグネチャを計算（シングル × ハッシュ関数の行列で一括計算）"""
+    hashes = shingles(text)
+    if not hashes:
+        return array('I', [_MAX_HASH] * NUM_PERM)
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    if len(values) > MAX_SHINGLES:
+        # 選ぶシングルはハッシュ値だけで決まるため、ほぼ同じ長さの類似文書では同じシングルが残り、
+        # 類似度の推定はほぼ保たれる（MAX_SHINGLES 以下の文書のシグネチャは変わらない）
+        values = values[values <= np.uint64(_MAX_HASH * MAX_SHINGLES // len(values))]
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(values), _MINHASH_CHUNK):
+        chunk = values[start:start + _MINHASH_CHUNK, np.newaxis]
+        np.minimum(signature, _permuted_hashes(chunk).min(axis=0), out=signature)
+    return array('I', (signature & np.uint64(_MAX_HASH)).astype(np.uint32).tobytes())
+
+
+def estimate_similarity(sig1, sig2):
+    """2つのシグネチャから Jaccard 類似度を推定"""
+    matches = sum(1 for x, y in zip(sig1, sig2) if x == y)
+    return matches / NUM_PERM
+
+
+def context_key(model_id, check_items, options=None):
+    """過去結果を再利用できる条件（モデル・チェック項目・レポートの設定）のキーを作成"""
+    source = repr((model_id, list(check_items.items()), sorted((options or {}).items())))
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def make_diff(old_text, new_text, max_lines=200):
+    """過去の稟議書との差分を unified diff 形式で作成"""
+    diff = list(difflib.unified_diff(
+        (old_text or "").splitlines(),
+        (new_text or "").splitlines(),
+        fromfile="前回",
+        tofile="今回",
+        lineterm="",
+        n=1
+    ))
+    if len(diff) > max_lines:
+        omitted = len(diff) - max_lines
+        diff = diff[:max_lines] + [f"...（以下 {omitted} 行省略）"]
+    return "\n".join(diff)
+
+
+class SimilarityIndex:
+    """MinHash/LSH による類似稟議書インデックス
+
+    シグネチャと LSH バケットはメモリ上に保持し、本文とチェック結果は
+    SQLite に保存する。検索はバンドごとの辞書参照と候補のシグネチャ比較のみで、
+    10万件以上の登録でも1ミリ秒未満で完了する（検索前のシグネチャ計算は minhash_signature で
+    行列演算により行い、長文でもシングル数を MAX_SHINGLES 程度に抑える）。
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, bands=LSH_BANDS, max_docs=200000):
+        if NUM_PERM % bands != 0:
+            raise ValueError("bands は NUM_PERM の約数である必要があります")
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.max_docs = max_docs
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self._keys = {}
+        self._buckets = [dict() for _ in range(bands)]
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS checks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                context_key TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                text TEXT NOT NULL,
+                result TEXT NOT NULL,
+                model TEXT,
+                created_at TEXT
+            )"""
+        )
+        self._conn.commit()
+        self._load()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        r = self.rows
+        return [hash(tuple(signature[i * r:(i + 1) * r])) for i in range(self.bands)]
+
+    def _add_to_buckets(self, doc_id, signature, key):
+        self._signatures[doc_id] = signature
+        self._keys[doc_id] = key
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band].setdefault(band_key, []).append(doc_id)
+
+    def _remove_from_buckets(self, doc_id):
+        signature = self._signatures.pop(doc_id)
+        self._keys.pop(doc_id, None)
+        for band, band_key in enumerate(self._band_keys(signature)):
+            bucket = self._buckets[band].get(band_key)
+            if bucket:
+                bucket.remove(doc_id)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def _load(self):
+        """保存済みのシグネチャからインデックスを再構築"""
+        rows = self._conn.execute(
+            "SELECT id, context_key, signature FROM checks ORDER BY id DESC LIMIT ?",
+            (self.max_docs,)
+        ).fetchall()
+        for doc_id, key, blob in reversed(rows):
+            signature = array('I')
+            signature.frombytes(blob)
+            self._add_to_buckets(doc_id, signature, key)
+
+    def add(self, text, result, key, model=None, signature=None):
+        """チェック結果を登録"""
+        if signature is None:
+            signature = minhash_signature(text)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO checks (context_key, signature, text, result, model, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, signature.tobytes(), text, result, model,
+                 time.strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            self._conn.commit()
+            self._add_to_buckets(cursor.lastrowid, signature, key)
+
+            # 上限を超えた古いエントリは検索対象から外す
+            while len(self._signatures) > self.max_docs:
+                self._remove_from_buckets(next(iter(self._signatures)))
+        return cursor.lastrowid
+
+    def query(self, signature, key, threshold=0.8):
+        """しきい値以上で最も類似した過去のチェックを検索
+
+        Returns:
+            tuple: (doc_id, 推定類似度)。該当なしの場合は None
+        """
+        best = None
+        with self._lock:
+            candidates = set()
+            for band, band_key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            for doc_id in candidates:
+                if self._keys.get(doc_id) != key:
+                    continue
+                similarity = estimate_similarity(signature, self._signatures[doc_id])
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (doc_id, similarity)
+        return best
+
+    def get(self, doc_id):
+        """登録済みのチェック内容を取得"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, result, model, created_at FROM checks WHERE id = ?",
+                (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': doc_id,
+            'text': row[0],
+            'result': row[1],
+            'model': row[2],
+            'created_at': row[3]
+        }
@@ -0,0 +1,213 @@
+"""起動時間の計測と Bedrock 接続の事前準備
+
+アプリからは StartupReport と BedrockWarmer を使い、起動フェーズごとの所要時間を記録する。
+コマンドラインから実行すると、`python -X importtime` で依存ライブラリの
+読み込み時間の内訳を表示する。
+
+使用例:
+    python startup.py --top 15
+"""
+import argparse
+import ast
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_MODULE = "ringi_checker"
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class StartupReport:
+    """起動フェーズごとの所要時間の記録"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = []
+
+    def record(self, name, seconds, detail=None):
+        with self._lock:
+            self.phases.append({'phase': name, 'seconds': seconds, 'detail': detail})
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, time.perf_counter() - start, f"失敗: {e}")
+            raise
+        self.record(name, time.perf_counter() - start)
+
+    def rows(self):
+        with self._lock:
+            return [dict(phase) for phase in self.phases]
+
+
+class BedrockWarmer:
+    """Bedrock Runtime クライアントをバックグラウンドで作成し、接続を事前に確立する
+
+    boto3 の読み込み・認証情報の解決・クライアント作成が終わった時点で client を使えるようにし、
+    その後 warmup_model_id を指定した場合は出力1トークンの Converse 呼び出しで
+    エンドポイントへの TLS 接続を張り、接続プールに残しておく。
+    クライアントはスレッドセーフなため、全セッションで共有する。
+    """
+
+    def __init__(self, report, region_name="us-east-1", max_pool_connections=10, warmup_model_id=None):
+        self.report = report
+        self.region_name = region_name
+        self.max_pool_connections = max_pool_connections
+        self.warmup_model_id = warmup_model_id
+        self.client = None
+        self.error = None
+        self.connected = False
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """クライアントの作成完了を待って返す（失敗時は None）"""
+        self._ready.wait(timeout)
+        return self.client
+
+    def _run(self):
+        try:
+            with self.report.phase("boto3 の読み込み"):
+                import boto3
+                from botocore.config import Config
+            with self.report.phase("AWS 認証情報の解決"):
+                session = boto3.Session(region_name=self.region_name)
+                credentials = session.get_credentials()
+                if credentials is not None:
+                    credentials.get_frozen_credentials()
+            with self.report.phase("Bedrock クライアント作成"):
+                self.client = session.client(
+                    service_name='bedrock-runtime',
+                    config=Config(max_pool_connections=self.max_pool_connections)
+                )
+        except Exception as e:
+            self.error = e
+            return
+        finally:
+            self._ready.set()
+
+        if self.warmup_model_id is None:
+            return
+        try:
+            with self.report.phase("Bedrock への接続（最小の Converse 呼び出し）"):
+                self.client.converse(
+                    modelId=self.warmup_model_id,
+                    messages=[{"role": "user", "content": [{"text": "."}]}],
+                    inferenceConfig={"maxTokens": 1}
+                )
+            self.connected = True
+        except Exception:
+            # 事前接続に失敗しても、最初の呼び出し時に接続するだけなので続行する
+            pass
+
+
+def parse_importtime(output):
+    """`-X importtime` の出力からトップレベルのモジュールごとの累積読み込み時間（秒）を取得"""
+    times = {}
+    for line in output.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match and len(match.group(3)) == 1:
+            times[match.group(4)] = int(match.group(2)) / 1_000_000
+    return times
+
+
+def _is_third_party(name):
+    return name not in sys.stdlib_module_names and name != "__future__"
+
+
+def _local_module_path(name):
+    path = os.path.join(APP_DIR, f"{name}.py")
+    return path if os.path.exists(path) else None
+
+
+def _imported_names(node):
+    if isinstance(node, ast.Import):
+        return [alias.name.split(".")[0] for alias in node.names]
+    if isinstance(node, ast.ImportFrom) and node.module and not node.level:
+        return [node.module.split(".")[0]]
+    return []
+
+
+def app_imports(app_module=APP_MODULE):
+    """アプリのソースから、起動時に読み込むモジュールと関数内で遅延読み込みするモジュールを取得
+
+    起動時に読み込むのはアプリのモジュールレベルの import、遅延読み込みはアプリと同じ
+    ディレクトリのモジュールの関数内の import（標準ライブラリと起動時に読み込むものは除く）。
+    """
+    with open(_local_module_path(app_module), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    eager = []
+    for node in tree.body:
+        eager.extend(name for name in _imported_names(node) if _is_third_party(name) and name not in eager)
+
+    lazy = []
+    for name in [app_module] + [name for name in eager if _local_module_path(name)]:
+        with open(_local_module_path(name), encoding="utf-8") as f:
+            module_tree = ast.parse(f.read())
+        for function in ast.walk(module_tree):
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for node in ast.walk(function):
+                lazy.extend(
+                    imported for imported in _imported_names(node)
+                    if _is_third_party(imported) and imported not in eager and imported not in lazy
+                )
+    return eager, lazy
+
+
+_MEASURE_SCRIPT = """
+import sys
+for name in sys.argv[1:]:
+    try:
+        __import__(name)
+    except ImportError:
+        print(name)
+"""
+
+
+def measure_imports(modules):
+    """新しいプロセスでモジュールを読み込み、モジュールごとの累積読み込み時間を返す
+
+    インストールされていないモジュール（OCR 用のライブラリなど任意のもの）は None とする。
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _MEASURE_SCRIPT, *modules],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    missing = set(result.stdout.split())
+    times = parse_importtime(result.stderr)
+    return {name: None if name in missing else times.get(name, 0.0) for name in modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="稟議書チェッカーの起動時間（モジュール読み込み）の内訳")
+    parser.add_argument("--top", type=int, default=10, help="表示するモジュール数")
+    args = parser.parse_args()
+
+    eager, lazy = app_imports()
+    for title, modules in (("起動時に読み込むモジュール", eager), ("遅延読み込みするモジュール", lazy)):
+        times = measure_imports(modules)
+        print(f"{title}: 合計 {sum(seconds for seconds in times.values() if seconds is not None):.3f}秒")
+        ranked = sorted(times.items(), key=lambda item: -1 if item[1] is None else item[1], reverse=True)
+        for name, seconds in ranked[:args.top]:
+            print(f"  {'未インストール':>9}  {name}" if seconds is None else f"  {seconds:>8.3f}秒  {name}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
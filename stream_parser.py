@@ -0,0 +1,75 @@
+import re
+
+_SCORE_RE = re.compile(r'評価点数\**\s*[：:]\s*\**\s*(\d{1,3})\s*/\s*100')
+_APPROVAL_RE = re.compile(r'承認可否\**\s*[：:]\s*\**\s*([○△×])')
+_RATING_RE = re.compile(
+    r'\*\*(?P<category>[^*]+?)\*\*\s*[：:]\s*(?P<stars>[⭐★☆]*)\s*[（(]\s*(?P<rating>[0-5](?:\.\d)?)\s*/\s*5\s*[)）]'
+)
+# 総合評価の次のセクション見出し（ここまで来れば概要は出揃っている）
+_SUMMARY_END_RE = re.compile(r'^##\s*(✅|⚠️|💡|📋)')
+
+
+class ReportStreamParser:
+    """ストリーミング中のチェック結果から評価点数・承認可否・カテゴリ別評価を逐次抽出
+
+    行が完結した時点で解析するため、`create_check_prompt` の出力形式で
+    先頭に出力される総合評価は、レポート全体の生成完了を待たずに取得できる。
+    """
+
+    def __init__(self, categories=None):
+        self.categories = list(categories or [])
+        self.score = None
+        self.approval = None
+        self.category_ratings = {}
+        self.summary_complete = False
+        self._buffer = ""
+        self._in_summary = False
+
+    def feed(self, chunk):
+        """テキスト断片を追加し、新たに確定した項目名の集合を返す"""
+        self._buffer += chunk
+        updated = set()
+        while "\n" in self._buffer:
+            line, self._buffer = self._buffer.split("\n", 1)
+            updated |= self._parse_line(line)
+        return updated
+
+    def close(self):
+        """残りのバッファを解析（ストリーム終了時に呼び出す）"""
+        updated = self._parse_line(self._buffer) if self._buffer else set()
+        self._buffer = ""
+        if not self.summary_complete and (self.score is not None or self.approval is not None):
+            self.summary_complete = True
+            updated.add('summary')
+        return updated
+
+    def _parse_line(self, line):
+        updated = set()
+        if "総合評価" in line and line.lstrip().startswith("#"):
+            self._in_summary = True
+
+        if self.score is None:
+            match = _SCORE_RE.search(line)
+            if match:
+                self.score = min(int(match.group(1)), 100)
+                updated.add('score')
+
+        if self.approval is None:
+            match = _APPROVAL_RE.search(line)
+            if match:
+                self.approval = match.group(1)
+                updated.add('approval')
+
+        if not self.summary_complete:
+            match = _RATING_RE.search(line)
+            if match:
+                category = match.group('category').strip()
+                if not self.categories or category in self.categories:
+                    self.category_ratings[category] = float(match.group('rating'))
+                    updated.add('category_ratings')
+
+            all_rated = self.categories and all(c in self.category_ratings for c in self.categories)
+            if all_rated or (self._in_summary and _SUMMARY_END_RE.match(line.strip())):
+                self.summary_complete = True
+                updated.add('summary')
+        return updated
@@ -1,6 +1,6 @@
 import streamlit as st
 import boto3
-import json
+import model_provider
 from datetime import datetime
 
 # ページ設定
@@ -56,6 +56,10 @@ CLAUDE_MODELS = {
     }
 }
 
+# ローカルバックエンド（LOCAL_LLM_BASE_URL 設定時のみ）
+if model_provider.local_model_config():
+    CLAUDE_MODELS["Local LLM"] = model_provider.local_model_config()
+
 def initialize_bedrock_client():
     """Bedrock Runtime クライアントを初期化"""
     try:
@@ -67,78 +71,13 @@ def initialize_bedrock_client():
         st.error(f"AWS 接続エラー: {e}")
         return None
 
-def call_claude(client, model_id, prompt, max_tokens=4000, temperature=0.7):
-    """Claude を呼び出す"""
-    
-    body = {
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    }
-    
-    try:
-        response = client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body),
-            contentType='application/json'
-        )
-        
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-        
-    except Exception as e:
-        st.error(f"Claude 呼び出しエラー: {e}")
-        return None
-
-def call_nova(client, model_id, prompt, max_tokens=4000, temperature=0.7):
-    """Amazon Nova を呼び出す"""
-    
-    body = {
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "text": prompt
-                    }
-                ]
-            }
-        ],
-        "inferenceConfig": {
-            "max_new_tokens": max_tokens,
-            "temperature": temperature
-        }
-    }
-    
+def call_model_stream(client, model_id, provider, prompt, max_tokens=4000, temperature=0.7, status=None):
+    """プロバイダーに応じてモデルをストリーミングで呼び出す（Bedrock は ConverseStream API）"""
     try:
-        response = client.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body),
-            contentType='application/json'
-        )
-        
-        response_body = json.loads(response['body'].read())
-        return response_body['output']['message']['content'][0]['text']
-        
+        backend = model_provider.get_provider(provider, client)
+        yield from backend.stream(model_id, prompt, max_tokens, temperature, status)
     except Exception as e:
-        st.error(f"Nova 呼び出しエラー: {e}")
-        return None
-
-def call_model(client, model_id, provider, prompt, max_tokens=4000, temperature=0.7):
-    """プロバイダーに応じてモデルを呼び出す"""
-    if provider == "Anthropic":
-        return call_claude(client, model_id, prompt, max_tokens, temperature)
-    elif provider == "Amazon":
-        return call_nova(client, model_id, prompt, max_tokens, temperature)
-    else:
-        st.error(f"サポートされていないプロバイダー: {provider}")
-        return None
+        st.error(f"{provider} 呼び出しエラー: {e}")
 
 def main():
     # タイトル
@@ -233,21 +172,27 @@ def main():
         
         # Claude の応答を取得・表示
         with st.chat_message("assistant"):
-            with st.spinner(f"{selected_model} が考えています..."):
-                response = call_model(
-                    st.session_state.bedrock_client, 
-                    model_info['model_id'],
-                    model_info['provider'],
-                    prompt, 
-                    max_tokens, 
-                    temperature
-                )
+            status = {}
+            response = st.write_stream(call_model_stream(
+                st.session_state.bedrock_client, 
+                model_info['model_id'],
+                model_info['provider'],
+                prompt, 
+                max_tokens, 
+                temperature,
+                status
+            ))
             
             if response:
-                st.markdown(response)
                 response_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 st.caption(f"応答時刻: {response_timestamp}")
                 st.caption(f"使用モデル: {selected_model}")
+                usage = status.get('usage') or {}
+                if usage.get('inputTokens') is not None and usage.get('outputTokens') is not None:
+                    st.caption(
+                        f"トークン数: 入力 {usage['inputTokens']:,} / 出力 {usage['outputTokens']:,}"
+                        f"（停止理由: {status.get('stop_reason', 'N/A')}）"
+                    )
                 
                 # アシスタントメッセージを履歴に追加
                 st.session_state.messages.append({
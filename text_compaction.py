@@ -0,0 +1,194 @@
+import math
+import re
+from collections import Counter
+
+from token_budget import estimate_tokens
+
+# ヘッダー・フッターとみなすページ先頭・末尾の行数
+EDGE_LINES = 4
+# 何割以上のページに出現した行を定型文とみなすか
+REPEAT_RATIO = 0.6
+# これより少ないページ数の文書では何も除去しない（本文の誤削除を避ける）
+MIN_PAGES = 3
+
+_PAGE_NUMBER_RE = re.compile(
+    r'^[\s\-–—・]*(?:'
+    r'(?P<bare>\d+)|'
+    r'(?P<fraction>\d+)\s*/\s*\d+|'
+    r'(?:page|p\.)\s*(?P<page>\d+)(?:\s*(?:of|/)\s*\d+)?|'
+    r'(?P<suffix>\d+)\s*(?:ページ|頁)|'
+    r'第\s*(?P<prefix>\d+)\s*(?:ページ|頁)'
+    r')[\s\-–—・]*$',
+    re.IGNORECASE
+)
+# 罫線として出力される文字の連続
+_RULE_CHARS = r'─━│┃┌┐└┘├┤┬┴┼┏┓┗┛┣┫┳┻╋═║╔╗╚╝\-_=|＿－＝｜'
+_RULE_RUN_RE = re.compile(f'[{_RULE_CHARS}]{{3,}}')
+_RULE_ONLY_RE = re.compile(f'^[\\s{_RULE_CHARS}+]*$')
+_CELL_SEPARATOR_RE = re.compile(r'\s*[│┃|｜]\s*')
+# 表抽出で整形済みの Markdown 表の行
+_MARKDOWN_TABLE_RE = re.compile(r'^\|.*\|$')
+# 日付だけの行（ヘッダー・フッターの作成日など）
+_DATE_ONLY_RE = re.compile(
+    r'^[\s\-–—・]*(?:(?:令和|平成|R|H)?\s*\d{1,4}\s*[年/.\-]\s*\d{1,2}\s*[月/.\-]\s*\d{1,2}\s*日?)[\s\-–—・]*$'
+)
+# 表の集計結果の行（pdf_extraction.summarize_table の出力）
+_AGGREGATION_MARK = "〔自動集計〕"
+
+
+def _line_key(line, ignore_digits=False):
+    """行を比較するためのキー（ignore_digits の場合は数字の違いを無視）"""
+    key = re.sub(r'\s+', '', line)
+    return re.sub(r'\d+', '#', key) if ignore_digits else key
+
+
+def _edge_key(line):
+    """ヘッダー・フッター候補として比較するキー
+
+    ページ番号・日付だけの行は数字の違いを無視し、それ以外の行は完全一致で比較する。
+    表の行と表の集計結果は金額などの本文のため候補にしない（None）。
+    """
+    stripped = line.strip()
+    if _MARKDOWN_TABLE_RE.match(stripped) or _AGGREGATION_MARK in stripped:
+        return None
+    ignore_digits = _page_number(stripped) is not None or bool(_DATE_ONLY_RE.match(stripped))
+    return _line_key(line, ignore_digits)
+
+
+def _edge_positions(lines):
+    """空行を除いたページ先頭・末尾の行の位置（先頭からは 0, 1, ...、末尾からは -1, -2, ...）"""
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    # 短いページでは本文をヘッダー・フッターと誤認しないよう範囲を狭める
+    edge_lines = max(1, min(EDGE_LINES, len(non_empty) // 4))
+    positions = {}
+    for offset, i in enumerate(non_empty[-edge_lines:][::-1]):
+        positions[i] = -(offset + 1)
+    for offset, i in enumerate(non_empty[:edge_lines]):
+        positions[i] = offset
+    return positions
+
+
+def _page_number(line):
+    """ページ番号の書式の行なら番号を返す"""
+    match = _PAGE_NUMBER_RE.match(line.strip())
+    if not match:
+        return None
+    return int(next(value for value in match.groupdict().values() if value is not None))
+
+
+def find_page_number_lines(pages):
+    """ページ先頭・末尾の行のうち、ページの並びと連番になっているページ番号の行を検出
+
+    Returns:
+        set: (ページのインデックス, 行のインデックス) の集合
+    """
+    candidates = []
+    for page_index, page in enumerate(pages):
+        lines = page.splitlines()
+        non_empty = [i for i, line in enumerate(lines) if line.strip()]
+        for i in dict.fromkeys(non_empty[:1] + non_empty[-1:]):
+            number = _page_number(lines[i])
+            if number is not None:
+                candidates.append((page_index, i, number - page_index))
+    if not candidates:
+        return set()
+
+    # 「番号 - ページのインデックス」が多くのページで一致するものを連番とみなす
+    offset, count = Counter(
+        offset for _, offset in {(page_index, offset) for page_index, _, offset in candidates}
+    ).most_common(1)[0]
+    if count < max(2, math.ceil(len(pages) * REPEAT_RATIO)):
+        return set()
+    return {(page_index, i) for page_index, i, candidate in candidates if candidate == offset}
+
+
+def collapse_table_noise(text):
+    """pdfplumber が出力する罫線・空セルのノイズを圧縮"""
+    lines = []
+    for line in text.splitlines():
+        # 整形済みの Markdown 表はそのまま残す
+        if _MARKDOWN_TABLE_RE.match(line.strip()):
+            lines.append(line.rstrip())
+            continue
+        # 罫線だけの行は削除
+        if line.strip() and _RULE_ONLY_RE.match(line):
+            continue
+        line = _RULE_RUN_RE.sub(' ', line)
+        # 区切り線で分割されたセルは1つの区切りにまとめる
+        if '│' in line or '|' in line or '｜' in line:
+            cells = [cell for cell in _CELL_SEPARATOR_RE.split(line) if cell.strip()]
+            line = ' | '.join(cell.strip() for cell in cells)
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+def find_repeated_lines(pages):
+    """ページ先頭・末尾で繰り返し出現するヘッダー・フッターを検出
+
+    Returns:
+        set: (ページ先頭・末尾からの位置, 行キー) の集合
+    """
+    if len(pages) < MIN_PAGES:
+        return set()
+
+    threshold = max(2, math.ceil(len(pages) * REPEAT_RATIO))
+    edge_counts = Counter()
+    for page in pages:
+        lines = page.splitlines()
+        edge_counts.update({
+            (position, _edge_key(lines[i]))
+            for i, position in _edge_positions(lines).items()
+            if _edge_key(lines[i]) is not None
+        })
+    return {key for key, count in edge_counts.items() if count >= threshold}
+
+
+def compact_pages(pages):
+    """ページ間で重複するヘッダー・フッター・ページ番号と罫線ノイズを除去
+
+    繰り返し行は最初のページにのみ残し、ページ番号は全ページから削除する。
+    MIN_PAGES ページ未満の文書では罫線ノイズの圧縮のみ行う。
+
+    Returns:
+        tuple: (圧縮後のページ一覧, 削減レポート)
+    """
+    original_chars = sum(len(page) for page in pages)
+    original_tokens = sum(estimate_tokens(page) for page in pages)
+    edge_keys = find_repeated_lines(pages)
+    page_number_lines = find_page_number_lines(pages) if len(pages) >= MIN_PAGES else set()
+
+    compacted = []
+    seen = set()
+    removed_lines = 0
+    for page_index, page in enumerate(pages):
+        lines = page.splitlines()
+        positions = _edge_positions(lines)
+        kept = []
+        for i, line in enumerate(lines):
+            if not line.strip():
+                kept.append(line)
+                continue
+            if (page_index, i) in page_number_lines:
+                removed_lines += 1
+                continue
+            edge_key = _edge_key(line)
+            key = (positions.get(i), edge_key)
+            if edge_key is not None and key in edge_keys:
+                if key in seen:
+                    removed_lines += 1
+                    continue
+                seen.add(key)
+            kept.append(line)
+        compacted.append(collapse_table_noise("\n".join(kept)))
+
+    compacted_chars = sum(len(page) for page in compacted)
+    compacted_tokens = sum(estimate_tokens(page) for page in compacted)
+    report = {
+        'original_chars': original_chars,
+        'compacted_chars': compacted_chars,
+        'removed_chars': original_chars - compacted_chars,
+        'removed_tokens': original_tokens - compacted_tokens,
+        'removed_lines': removed_lines,
+        'repeated_patterns': len(edge_keys)
+    }
+    return compacted, report
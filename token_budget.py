@@ -0,0 +1,104 @@
+import math
+import re
+import threading
+
+# 文字種ごとの1文字あたりのトークン数（初期値。実測の入力トークン数でモデルごとに補正する）
+CHAR_CLASS_TOKENS = [
+    ("kanji", re.compile(r'[㐀-䶿一-鿿豈-﫿々〆]'), 1.1),
+    ("hiragana", re.compile(r'[ぁ-ゟ]'), 0.7),
+    ("katakana", re.compile(r'[゠-ヿｦ-ﾟー]'), 0.8),
+    ("fullwidth", re.compile(r'[、-〄〇-〿！-･①-⓿■-➿]'), 1.0),
+    ("ascii_letter", re.compile(r'[A-Za-z]'), 0.25),
+    ("digit", re.compile(r'[0-9]'), 0.4),
+    ("ascii_symbol", re.compile(r'[!-/:-@\[-`{-~]'), 0.5),
+    ("whitespace", re.compile(r'\s'), 0.1),
+]
+# 上記以外（絵文字・その他の記号など）
+OTHER_CHAR_TOKENS = 1.5
+
+# 補正係数の範囲と、実測値を反映する割合
+MIN_SCALE = 0.3
+MAX_SCALE = 3.0
+CALIBRATION_SMOOTHING = 0.2
+
+# レポートの詳細度ごとの出力トークン数（総合評価などの固定部分 + カテゴリごと）
+REPORT_PROFILES = {
+    "brief": {"label": "簡潔", "base_tokens": 500, "per_category_tokens": 120},
+    "standard": {"label": "標準", "base_tokens": 1000, "per_category_tokens": 300},
+    "full": {"label": "詳細", "base_tokens": 1800, "per_category_tokens": 600},
+}
+DEFAULT_REPORT_PROFILE = "standard"
+# 想定より長くなった場合に途中で切れないための余裕
+OUTPUT_MARGIN = 1.3
+MIN_OUTPUT_TOKENS = 512
+
+
+def estimate_tokens(text, scale=1.0):
+    """文字種ごとの重みでトークン数を推定（日本語の漢字・かな・全角記号を区別）"""
+    if not text:
+        return 0
+    total = 0.0
+    counted = 0
+    for _, pattern, weight in CHAR_CLASS_TOKENS:
+        count = len(pattern.findall(text))
+        total += count * weight
+        counted += count
+    total += (len(text) - counted) * OTHER_CHAR_TOKENS
+    return math.ceil(total * scale)
+
+
+class TokenEstimator:
+    """モデルごとに実測の入力トークン数で補正するトークン数推定"""
+
+    def __init__(self, smoothing=CALIBRATION_SMOOTHING):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._scales = {}
+        self._samples = {}
+
+    def scale(self, model_id):
+        """モデルの補正係数（実測がなければ 1.0）"""
+        with self._lock:
+            return self._scales.get(model_id, 1.0)
+
+    def samples(self, model_id):
+        with self._lock:
+            return self._samples.get(model_id, 0)
+
+    def estimate(self, text, model_id=None):
+        return estimate_tokens(text, self.scale(model_id))
+
+    def calibrate(self, model_id, text, actual_tokens):
+        """実際の入力トークン数（Converse API の usage.inputTokens）で補正係数を更新"""
+        estimated = estimate_tokens(text)
+        if not estimated or not actual_tokens:
+            return
+        ratio = min(MAX_SCALE, max(MIN_SCALE, actual_tokens / estimated))
+        with self._lock:
+            if model_id in self._scales:
+                ratio = self._scales[model_id] * (1 - self.smoothing) + ratio * self.smoothing
+            self._scales[model_id] = ratio
+            self._samples[model_id] = self._samples.get(model_id, 0) + 1
+
+
+def output_budget(category_count, profile=DEFAULT_REPORT_PROFILE, model_max_tokens=None):
+    """レポートの詳細度とカテゴリ数から max_tokens を決める（モデルの上限を超えない）"""
+    settings = REPORT_PROFILES[profile]
+    expected = settings['base_tokens'] + settings['per_category_tokens'] * category_count
+    budget = max(MIN_OUTPUT_TOKENS, math.ceil(expected * OUTPUT_MARGIN))
+    return min(budget, model_max_tokens) if model_max_tokens else budget
+
+
+def context_status(input_tokens, max_tokens, context_window):
+    """入力と出力の合計がコンテキスト長に収まるか
+
+    Returns:
+        str: "ok" / "tight"（出力の上限まで生成すると超える）/ "over"（入力だけで超える）
+    """
+    if not context_window:
+        return "ok"
+    if input_tokens >= context_window:
+        return "over"
+    if input_tokens + max_tokens > context_window:
+        return "tight"
+    return "ok"